@@ -350,6 +350,18 @@ def task_test():
         )
 
 
+def task_benchmark():
+    """compare the JSON serializers on a synthetic large collection"""
+    return U._do(
+        dict(
+            uptodate=[lambda: False],
+            actions=[[C.PY, "-m", "janki.benchmark"]],
+            file_dep=[B.OK_EXT_DEV],
+        ),
+        cwd=P.SRC_PY / "janki",
+    )
+
+
 def task_lab():
     """start jupyterlab"""
 
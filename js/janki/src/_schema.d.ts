@@ -217,3 +217,19 @@ export interface Rev {
   usn: number;
   [k: string]: unknown;
 }
+/**
+ * a collection, with each table as `columns` and `rows` of values
+ */
+export interface ColumnarCollection {
+  cards: ColumnarTable;
+  col: ColumnarTable;
+  notes: ColumnarTable;
+  path: string;
+  revlog?: ColumnarTable;
+  [k: string]: unknown;
+}
+export interface ColumnarTable {
+  columns: string[];
+  rows: unknown[][];
+  [k: string]: unknown;
+}
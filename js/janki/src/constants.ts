@@ -21,6 +21,11 @@ export const JSON_FIELDS: Record<string, string[]> = {
   col: ['conf', 'dconf', 'decks', 'tags', 'models'],
 };
 
+/**
+ * The most responses kept to revalidate, the least recently used being dropped
+ */
+export const VALIDATED_MAX_ENTRIES = 32;
+
 export const FIELD_DELIMITER = '\u001f';
 
 export const APKG_COLLECTION = 'collection.anki2';
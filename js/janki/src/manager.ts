@@ -7,11 +7,16 @@ import { ServerConnection } from '@jupyterlab/services';
 import { PromiseDelegate } from '@lumino/coreutils';
 
 import * as SCHEMA from './_schema';
-import { API_NS } from './constants';
+import { API_NS, VALIDATED_MAX_ENTRIES } from './constants';
 import { ICardManager } from './tokens';
 
 export class CardManager implements ICardManager {
   private _ready = new PromiseDelegate<void>();
+  /**
+   * The last response for recently used URLs, with the `Etag` it was validated
+   * with, in order of use
+   */
+  private _validated = new Map<string, { etag: string; data: any }>();
 
   constructor() {
     this._ready.resolve();
@@ -22,21 +27,136 @@ export class CardManager implements ICardManager {
   }
 
   async collection(...path: string[]): Promise<SCHEMA.Collection> {
-    return await this._fetch<SCHEMA.Collection>('collection', ...path);
+    return await this._fetch<SCHEMA.Collection>(['collection', ...path]);
   }
 
-  protected async _fetch<T>(...path: string[]): Promise<T> {
+  async page<T>(
+    path: string,
+    table: string,
+    options: ICardManager.IPageOptions = {}
+  ): Promise<ICardManager.IPage<T>> {
+    const query: Record<string, string> = {};
+    for (const [key, value] of Object.entries(options)) {
+      if (value != null) {
+        query[key] = `${value}`;
+      }
+    }
+    return await this._fetch<ICardManager.IPage<T>>(
+      ['collection', path, table],
+      query
+    );
+  }
+
+  async changes(path: string, since = 0): Promise<ICardManager.IChanges> {
+    return await this._fetch<ICardManager.IChanges>(['collection', path, 'changes'], {
+      since: `${since}`,
+    });
+  }
+
+  async columnar(path: string): Promise<SCHEMA.ColumnarCollection> {
+    return await this._fetch<SCHEMA.ColumnarCollection>(
+      ['collection', path],
+      { format: 'columnar' }
+    );
+  }
+
+  async search(
+    path: string,
+    q: string,
+    limit?: number
+  ): Promise<ICardManager.ISearch> {
+    const query: Record<string, string> = { q };
+    if (limit != null) {
+      query.limit = `${limit}`;
+    }
+    return await this._fetch<ICardManager.ISearch>(
+      ['collection', path, 'search'],
+      query
+    );
+  }
+
+  async query(
+    path: string,
+    q: string,
+    options: ICardManager.IQueryOptions = {}
+  ): Promise<ICardManager.IQuery> {
+    const query: Record<string, string> = { q };
+    for (const [key, value] of Object.entries(options)) {
+      if (value != null) {
+        query[key] = `${value}`;
+      }
+    }
+    return await this._fetch<ICardManager.IQuery>(['collection', path, 'query'], query);
+  }
+
+  async stats(path: string): Promise<ICardManager.IStats> {
+    return await this._fetch<ICardManager.IStats>(['collection', path, 'stats']);
+  }
+
+  async forecast(
+    path: string,
+    options: ICardManager.IForecastOptions = {}
+  ): Promise<ICardManager.IForecast> {
+    const query: Record<string, string> = {};
+    for (const [key, value] of Object.entries(options)) {
+      if (value != null) {
+        query[key] = `${value}`;
+      }
+    }
+    return await this._fetch<ICardManager.IForecast>(
+      ['collection', path, 'forecast'],
+      query
+    );
+  }
+
+  async catalog(): Promise<ICardManager.ICatalog> {
+    return await this._fetch<ICardManager.ICatalog>(['catalog']);
+  }
+
+  async write(
+    path: string,
+    rows: ICardManager.IWrite
+  ): Promise<ICardManager.IWritten> {
+    return await this._fetch<ICardManager.IWritten>(
+      ['collection', path],
+      {},
+      { method: 'POST', body: JSON.stringify(rows) }
+    );
+  }
+
+  protected async _fetch<T>(
+    path: string[],
+    query: Record<string, string> = {},
+    init: RequestInit = {}
+  ): Promise<T> {
     const settings = ServerConnection.makeSettings();
-    const requestUrl = URLExt.join(settings.baseUrl, ...API_NS, ...path);
+    const requestUrl =
+      URLExt.join(settings.baseUrl, ...API_NS, ...path) +
+      URLExt.objectToQueryString(query);
+
+    // only responses to `GET` are revalidated
+    const cacheable = init.method == null;
+    const validated = cacheable ? this._validated.get(requestUrl) : undefined;
+
+    if (validated) {
+      // move it to the end, as the most recently used
+      this._validated.delete(requestUrl);
+      this._validated.set(requestUrl, validated);
+      init = { ...init, headers: { 'If-None-Match': validated.etag } };
+    }
 
     let response: Response;
 
     try {
-      response = await ServerConnection.makeRequest(requestUrl, {}, settings);
+      response = await ServerConnection.makeRequest(requestUrl, init, settings);
     } catch (error) {
       throw new ServerConnection.NetworkError(error);
     }
 
+    if (validated && response.status === 304) {
+      return validated.data as T;
+    }
+
     let data: any = await response.text();
 
     if (data.length > 0) {
@@ -51,6 +171,19 @@ export class CardManager implements ICardManager {
       throw new ServerConnection.ResponseError(response, data.message || data);
     }
 
+    const etag = response.headers.get('Etag');
+
+    if (cacheable) {
+      this._validated.delete(requestUrl);
+    }
+
+    if (etag && cacheable) {
+      this._validated.set(requestUrl, { etag, data });
+      while (this._validated.size > VALIDATED_MAX_ENTRIES) {
+        this._validated.delete(this._validated.keys().next().value);
+      }
+    }
+
     return data as T;
   }
 }
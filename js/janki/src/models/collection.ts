@@ -4,9 +4,18 @@
 import { Model as ArchiveModel } from '@gt-coar/jupyterlab-libarchive';
 import { Model as DBModel } from '@gt-coar/jupyterlab-sqlite3';
 import { VDomModel } from '@jupyterlab/apputils';
+import { URLExt } from '@jupyterlab/coreutils';
+import { ServerConnection } from '@jupyterlab/services';
 
 import * as SCHEMA from '../_schema';
-import { DEBUG, JSON_FIELDS, APKG_MEDIA_JSON, APKG_COLLECTION } from '../constants';
+import {
+  API_NS,
+  DEBUG,
+  JSON_FIELDS,
+  APKG_MEDIA_JSON,
+  APKG_COLLECTION,
+} from '../constants';
+import { ICardManager } from '../tokens';
 
 export const Q_CARDS = `SELECT * from cards;`;
 export const Q_COLL_META = `SELECT * from col;`;
@@ -56,6 +65,28 @@ export class CollectionModel extends VDomModel {
     this.updateCollection().catch(console.error);
   }
 
+  /**
+   * Merge rows changed since a watermark into the collection, and drop deleted rows
+   */
+  applyChanges(changes: ICardManager.IChanges): void {
+    const collection: Record<string, any> = this._collection;
+    if (!collection) {
+      return;
+    }
+    for (const table of ['cards', 'col', 'notes', 'revlog']) {
+      const rows = (changes as Record<string, any>)[table];
+      if (rows) {
+        collection[table] = { ...collection[table], ...rows };
+      }
+    }
+    for (const [table, ids] of Object.entries(changes.deleted || {})) {
+      for (const id of ids) {
+        delete collection[table]?.[id];
+      }
+    }
+    this.stateChanged.emit(void 0);
+  }
+
   protected async updateCollection(): Promise<void> {
     this._dbModel = new DBModel();
     this._dbModel.stateChanged.connect(this.dbModelChanged, this);
@@ -110,12 +141,17 @@ export class CollectionModel extends VDomModel {
     }
 
     if (Object.keys(mediaMap).length) {
+      const { baseUrl } = ServerConnection.makeSettings();
       const media: Record<string, string> = {};
-      // iterate again for media
-      for (const [path, member] of this._archiveModel.members.entries()) {
-        if (mediaMap[path]) {
-          media[mediaMap[path]] = URL.createObjectURL(await member.file.extract());
-        }
+      // media are streamed by the server, on demand, rather than extracted here
+      for (const name of Object.values(mediaMap)) {
+        media[name] = URLExt.join(
+          baseUrl,
+          ...API_NS,
+          'package',
+          URLExt.encodeParts(this._path),
+          encodeURIComponent(name)
+        );
       }
       DEBUG && console.info(media);
       this._media = media;
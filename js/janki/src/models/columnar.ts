@@ -0,0 +1,77 @@
+// Copyright (c) 2021 University System of Georgia and janki contributors
+// Distributed under the terms of the BSD-3-Clause License.
+
+import * as SCHEMA from '../_schema';
+
+/**
+ * A read-only view of a columnar table, which only builds row objects on demand
+ */
+export class ColumnarTable<T extends Record<string, any>> implements Iterable<T> {
+  private _columns: string[];
+  private _rows: any[][];
+  private _indices: Map<string, number>;
+  private _byId: Map<number, number> | null = null;
+
+  constructor(table: SCHEMA.ColumnarTable) {
+    this._columns = table.columns;
+    this._rows = table.rows;
+    this._indices = new Map(this._columns.map((column, i) => [column, i]));
+  }
+
+  get columns(): string[] {
+    return this._columns;
+  }
+
+  get length(): number {
+    return this._rows.length;
+  }
+
+  /**
+   * A single value, without building the row
+   */
+  value<K extends keyof T & string>(index: number, column: K): T[K] | undefined {
+    const i = this._indices.get(column);
+    return i == null ? undefined : this._rows[index]?.[i];
+  }
+
+  /**
+   * All the values of one column
+   */
+  column<K extends keyof T & string>(column: K): T[K][] {
+    const i = this._indices.get(column);
+    return i == null ? [] : this._rows.map((values) => values[i]);
+  }
+
+  /**
+   * The row at an index, as an object
+   */
+  row(index: number): T | undefined {
+    const values = this._rows[index];
+    if (!values) {
+      return;
+    }
+    const row: Record<string, any> = {};
+    for (let i = 0; i < this._columns.length; i++) {
+      row[this._columns[i]] = values[i];
+    }
+    return row as T;
+  }
+
+  /**
+   * The row with an `id`, indexing the ids on first use
+   */
+  get(id: number | string): T | undefined {
+    if (!this._byId) {
+      const ids = this.column('id' as keyof T & string);
+      this._byId = new Map(ids.map((rowId, index) => [rowId, index]));
+    }
+    const index = this._byId.get(+id);
+    return index == null ? undefined : this.row(index);
+  }
+
+  *[Symbol.iterator](): Iterator<T> {
+    for (let i = 0; i < this._rows.length; i++) {
+      yield this.row(i) as T;
+    }
+  }
+}
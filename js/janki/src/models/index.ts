@@ -2,3 +2,4 @@
 // Distributed under the terms of the BSD-3-Clause License.
 
 export * from './collection';
+export * from './columnar';
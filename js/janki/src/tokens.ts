@@ -16,6 +16,210 @@ export const ICardManager = new Token<ICardManager>(PLUGIN_ID);
 export interface ICardManager {
   ready: Promise<void>;
   collection(...path: string[]): Promise<SCHEMA.Collection>;
+  page<T>(
+    path: string,
+    table: string,
+    options?: ICardManager.IPageOptions
+  ): Promise<ICardManager.IPage<T>>;
+  changes(path: string, since?: number): Promise<ICardManager.IChanges>;
+  columnar(path: string): Promise<SCHEMA.ColumnarCollection>;
+  search(path: string, q: string, limit?: number): Promise<ICardManager.ISearch>;
+  query(
+    path: string,
+    q: string,
+    options?: ICardManager.IQueryOptions
+  ): Promise<ICardManager.IQuery>;
+  stats(path: string): Promise<ICardManager.IStats>;
+  forecast(
+    path: string,
+    options?: ICardManager.IForecastOptions
+  ): Promise<ICardManager.IForecast>;
+  catalog(): Promise<ICardManager.ICatalog>;
+  write(path: string, rows: ICardManager.IWrite): Promise<ICardManager.IWritten>;
+}
+
+export namespace ICardManager {
+  export interface IPageOptions {
+    /**
+     * The `next` cursor of the previous page
+     */
+    after?: string | null;
+    limit?: number;
+    /**
+     * A column to order the rows by, before their `id`
+     */
+    sort?: string;
+  }
+
+  export interface IPage<T> {
+    path: string;
+    table: string;
+    sort: string;
+    rows: T[];
+    next: string | null;
+  }
+
+  /**
+   * The rows of a collection changed since a watermark, in seconds
+   */
+  export interface IChanges extends Partial<SCHEMA.Collection> {
+    since: number;
+    /**
+     * The latest change, to request the next changes `since`
+     */
+    watermark: number;
+    /**
+     * Ids of deleted rows, keyed by table
+     */
+    deleted: Record<string, number[]>;
+  }
+
+  /**
+   * A note matching a full-text search
+   */
+  export interface ISearchResult {
+    /**
+     * The note id
+     */
+    id: number;
+    /**
+     * The BM25 rank: lower is better
+     */
+    rank: number;
+    /**
+     * HTML-escaped text around the matches in the note's fields, which are marked
+     * with `<mark>`
+     */
+    snippet: string;
+    tags: string[];
+    /**
+     * The ids of the note's cards
+     */
+    cards: number[];
+  }
+
+  export interface ISearch {
+    path: string;
+    q: string;
+    results: ISearchResult[];
+  }
+
+  export interface IQueryOptions {
+    /**
+     * A column of `cards` to order by, descending if it starts with `-`
+     */
+    order?: string;
+    limit?: number;
+  }
+
+  /**
+   * The cards matching a query like `deck:1 queue:review due<10`, and their notes
+   */
+  export interface IQuery extends Pick<SCHEMA.Collection, 'cards' | 'notes'> {
+    path: string;
+    q: string;
+    order: string;
+  }
+
+  /**
+   * Review statistics. Times are in ms, and ease factors in permille
+   */
+  export interface IStats {
+    path: string;
+    /**
+     * Reviews on each UTC day, as days since the epoch
+     */
+    days: { day: number; reviews: number; correct: number; time: number }[];
+    /**
+     * Correct reviews, by the previous interval in days, `max` of `null` is unbounded
+     */
+    retention: {
+      min: number;
+      max: number | null;
+      reviews: number;
+      correct: number;
+      retention: number;
+    }[];
+    ease: { factor: number; cards: number }[];
+    time: { type: number; reviews: number; time: number }[];
+    buttons: { type: number; ease: number; reviews: number }[];
+  }
+
+  export interface IForecastOptions {
+    days?: number;
+    /**
+     * The chance of passing each review, from 0 to 1
+     */
+    retention?: number;
+    /**
+     * The number of new cards introduced each day
+     */
+    new?: number;
+    seed?: number;
+  }
+
+  /**
+   * The simulated reviews, and new cards introduced, on each of the coming days
+   */
+  export interface IForecast {
+    path: string;
+    /**
+     * The collection's day number, counted from its creation
+     */
+    today: number;
+    days: number;
+    reviews: number[];
+    new: number[];
+  }
+
+  /**
+   * A summary of a collection, or the `error` met while summarizing it
+   */
+  export interface ICatalogEntry {
+    path: string;
+    /**
+     * The last modification of the file, in seconds
+     */
+    mtime: number;
+    size: number;
+    cards?: number;
+    notes?: number;
+    revlog?: number;
+    decks?: string[];
+    error?: string;
+  }
+
+  /**
+   * The collections under the server's root, as last scanned
+   */
+  export interface ICatalog {
+    collections: ICatalogEntry[];
+    /**
+     * When the last scan finished, in seconds, or `null` before the first
+     */
+    updated: number | null;
+    scanning: boolean;
+  }
+
+  /**
+   * Notes and cards to write: rows with the `id` of an existing row update the
+   * columns they give, and others are inserted. `mod`, `usn`, `sfld` and `csum`
+   * are maintained by the server.
+   */
+  export interface IWrite {
+    notes?: Record<string, any>[];
+    cards?: Record<string, any>[];
+  }
+
+  /**
+   * The ids of the written rows, in order, and the new `mod` of the collection
+   */
+  export interface IWritten {
+    path: string;
+    notes: number[];
+    cards: number[];
+    mod: number;
+  }
 }
 
 export const CSS = {
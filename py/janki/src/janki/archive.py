@@ -0,0 +1,127 @@
+"""indexes of the members, and media, of ``.apkg`` archives, for opening members
+without reading the zip central directory
+"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import functools
+import json
+import shutil
+import struct
+import zipfile
+
+from .cache import atomic_write, index_key
+from .constants import APKG_MEDIA_JSON, CHUNK_SIZE
+
+#: the fields of a member kept in an index, in order
+ENTRY_FIELDS = [
+    "header_offset",
+    "compress_type",
+    "compress_size",
+    "file_size",
+    "CRC",
+    "flag_bits",
+]
+
+# the positions of the name and extra field lengths in a local file header
+_FH_FILENAME_LENGTH = 10
+_FH_EXTRA_FIELD_LENGTH = 11
+
+
+def build_index(archive_path, key):
+    """read the central directory, and ``media`` map, of an archive"""
+    with zipfile.ZipFile(str(archive_path)) as archive:
+        members = {
+            info.filename: [getattr(info, field) for field in ENTRY_FIELDS]
+            for info in archive.infolist()
+        }
+        try:
+            media = json.loads(archive.read(APKG_MEDIA_JSON) or b"{}")
+        except KeyError:
+            media = {}
+
+    return {
+        "key": index_key(key),
+        "members": members,
+        "media": {name: member for member, name in media.items()},
+    }
+
+
+@functools.lru_cache(maxsize=64)
+def read_index(archive_path, index_path, key):
+    """the index of an archive, from ``index_path`` if it was built from the same
+    version of the archive, or built and written there
+
+    indexes are kept in memory, per process, by the archive's ``key``
+    """
+    try:
+        index = json.loads(index_path.read_bytes())
+        if index.get("key") == index_key(key):
+            return index
+    except (OSError, ValueError):
+        pass
+
+    index = build_index(archive_path, key)
+
+    with atomic_write(index_path) as tmp_path:
+        tmp_path.write_text(json.dumps(index), encoding="utf-8")
+
+    return index
+
+
+def member_info(name, entry):
+    """a ``ZipInfo`` for an indexed member"""
+    info = zipfile.ZipInfo(name)
+    for field, value in zip(ENTRY_FIELDS, entry):
+        setattr(info, field, value)
+    return info
+
+
+def open_member(archive_path, info):
+    """open a member of an archive at its local header, as ``ZipFile.open`` would"""
+    fp = open(archive_path, "rb")
+
+    try:
+        fp.seek(info.header_offset)
+        header = fp.read(zipfile.sizeFileHeader)
+
+        if len(header) != zipfile.sizeFileHeader:
+            raise zipfile.BadZipFile("Truncated file header")
+
+        header = struct.unpack(zipfile.structFileHeader, header)
+
+        if header[0] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile("Bad magic number for file header")
+
+        if info.flag_bits & 0x1:
+            raise RuntimeError(f"{info.filename} is encrypted")
+
+        fp.seek(header[_FH_FILENAME_LENGTH] + header[_FH_EXTRA_FIELD_LENGTH], 1)
+
+        return zipfile.ZipExtFile(fp, "r", info, close_fileobj=True)
+    except Exception:
+        fp.close()
+        raise
+
+
+def repackage(archive_path, dest_path, replacements):
+    """write a copy of an archive, with some members replaced by files, keeping the
+    order, names, compression and times of all members
+    """
+    with zipfile.ZipFile(str(archive_path)) as source:
+        with zipfile.ZipFile(str(dest_path), "w") as dest:
+            for info in source.infolist():
+                replacement = replacements.get(info.filename)
+                copy = zipfile.ZipInfo(info.filename, info.date_time)
+                copy.compress_type = info.compress_type
+                copy.external_attr = info.external_attr
+
+                if replacement is None:
+                    reader, size = source.open(info), info.file_size
+                else:
+                    reader, size = replacement.open("rb"), replacement.stat().st_size
+
+                force_zip64 = size > zipfile.ZIP64_LIMIT
+
+                with reader, dest.open(copy, "w", force_zip64=force_zip64) as writer:
+                    shutil.copyfileobj(reader, writer, CHUNK_SIZE)
@@ -0,0 +1,156 @@
+"""compare the JSON serializers on a synthetic large collection
+
+python -m janki.benchmark --copies 1000
+"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import argparse
+import json
+import logging
+import shutil
+import sqlite3
+import tempfile
+import timeit
+from contextlib import closing
+from pathlib import Path
+
+from tornado.escape import json_encode
+
+from .constants import JSON_FIELDS
+from .serializers import JSONSerializer, OrjsonSerializer, default_serializer_class
+from .store import CollectionStore
+
+HERE = Path(__file__).parent
+TEST_COLLECTION = HERE / "tests" / "fixtures" / "collection_v1.anki2"
+
+# far apart enough that copied ids never collide
+ID_OFFSET = 10**10
+
+#: the columns which are moved by ``ID_OFFSET`` in each copy of a table
+ID_COLUMNS = dict(notes=["id"], cards=["id", "nid"], revlog=["id", "cid"])
+
+
+def synthetic_col(models, decks):
+    """the ``JSON_FIELDS`` of a ``col`` row, with many note types and decks"""
+    html = "<div class=front>{{Front}}</div>" * 20
+    return dict(
+        conf={"activeDecks": [*range(decks)], "curModel": 1, "sortType": "noteFld"},
+        dconf={
+            str(i): {"id": i, "name": f"Options {i}", "new": {"delays": [1, 10]}}
+            for i in range(1, 1 + decks // 10)
+        },
+        decks={
+            str(i): {"id": i, "name": f"Course::Unit {i // 10}::Deck {i}", "conf": 1}
+            for i in range(1, 1 + decks)
+        },
+        models={
+            str(i): {
+                "id": i,
+                "name": f"Note Type {i}",
+                "css": ".card { font-family: arial; }" * 10,
+                "flds": [{"name": f"Field {j}", "ord": j} for j in range(8)],
+                "tmpls": [
+                    {"name": f"Card {j}", "ord": j, "qfmt": html, "afmt": html}
+                    for j in range(3)
+                ],
+            }
+            for i in range(1, 1 + models)
+        },
+        tags={f"tag{i}": 0 for i in range(decks)},
+    )
+
+
+def build(db_path, copies, models, decks):
+    """write a collection of ``copies`` of the test collection's notes, cards and
+    reviews, with a large ``col``
+    """
+    shutil.copy2(TEST_COLLECTION, db_path)
+
+    with closing(sqlite3.connect(str(db_path))) as db:
+        db.execute("PRAGMA journal_mode = DELETE;")
+
+        for table_name, id_columns in ID_COLUMNS.items():
+            columns = [row[1] for row in db.execute(f"PRAGMA table_info({table_name})")]
+            values = [f"{c} + :offset" if c in id_columns else c for c in columns]
+            (last,) = db.execute(f"SELECT MAX(id) FROM {table_name};").fetchone()
+            db.executemany(
+                f"INSERT INTO {table_name} ({', '.join(columns)}) "
+                f"SELECT {', '.join(values)} FROM {table_name} WHERE id <= :last;",
+                [dict(offset=i * ID_OFFSET, last=last) for i in range(1, copies)],
+            )
+
+        col = synthetic_col(models, decks)
+        db.execute(
+            f"UPDATE col SET {', '.join(f'{f} = ?' for f in JSON_FIELDS['col'])};",
+            [json.dumps(col[f]) for f in JSON_FIELDS["col"]],
+        )
+        db.commit()
+
+
+def best(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def run(copies, models, decks, repeat):
+    serializers = {"json": JSONSerializer()}
+
+    if default_serializer_class() is OrjsonSerializer:
+        serializers["orjson"] = OrjsonSerializer()
+
+    with tempfile.TemporaryDirectory() as td:
+        db_path = Path(td) / "collection.anki2"
+        build(db_path, copies, models, decks)
+
+        with closing(sqlite3.connect(str(db_path))) as db:
+            fields = db.execute(
+                f"SELECT {', '.join(JSON_FIELDS['col'])} FROM col;"
+            ).fetchone()
+
+        log = logging.getLogger(__name__)
+        log.setLevel(logging.ERROR)
+        stores = {
+            name: CollectionStore(
+                td, Path(td) / "cache", 0, serializer=serializer, log=log
+            )
+            for name, serializer in serializers.items()
+        }
+        response = stores["json"].load(db_path.name)
+        counts = {t: len(response[t]) for t in ["cards", "notes", "revlog"]}
+        print(
+            f"{counts}, col JSON_FIELDS {sum(map(len, fields)) // 1024} KiB, "
+            f"best of {repeat}"
+        )
+
+        timings = {"dumpb (tornado json_encode)": {}, "dumpb": {}, "decode col": {}}
+        timings["load"] = {}
+        timings["dumpb (tornado json_encode)"]["json"] = best(
+            lambda: json_encode(response).encode("utf-8"), repeat
+        )
+
+        for name, serializer in serializers.items():
+            timings["dumpb"][name] = best(lambda: serializer.dumpb(response), repeat)
+            timings["decode col"][name] = best(
+                lambda: [serializer.loads(value) for value in fields], repeat
+            )
+            timings["load"][name] = best(
+                lambda: stores[name].load(db_path.name), repeat
+            )
+
+    for task, by_serializer in timings.items():
+        for name, seconds in by_serializer.items():
+            print(f"{task:<30} {name:<8} {seconds * 1000:>10.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--copies", type=int, default=1000)
+    parser.add_argument("--models", type=int, default=200)
+    parser.add_argument("--decks", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    run(args.copies, args.models, args.decks, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
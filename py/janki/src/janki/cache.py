@@ -0,0 +1,357 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import hashlib
+import io
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from stat import S_ISDIR, S_IWGRP, S_IWOTH
+
+from .compression import compress, decompress
+from .constants import CHUNK_SIZE
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+#: the number of lock files a ``PayloadCache`` spreads its payloads over
+LOCK_STRIPES = 16
+
+#: the modes of directories, and files, which are private, or shared with a group
+DIR_MODES = {False: 0o700, True: 0o2770}
+FILE_MODES = {False: 0o600, True: 0o660}
+
+#: bump to rebuild all existing sidecar indexes, of archives and for search
+INDEX_VERSION = 1
+
+#: the suffix of the write-ahead log of a collection, which has its latest changes
+WAL_SUFFIX = "-wal"
+
+
+def fingerprint(path):
+    """the ``(mtime, size, inode)`` of a file, then the ``(mtime, size)`` of its
+    non-empty write-ahead log, or zeros
+
+    collections open in anki are in WAL mode, so changes reach the ``-wal`` file
+    long before the file itself. Returns ``None`` if the file does not exist.
+    """
+    path = Path(path)
+
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    try:
+        wal = (path.parent / (path.name + WAL_SUFFIX)).stat()
+        wal = (wal.st_mtime_ns, wal.st_size) if wal.st_size else (0, 0)
+    except FileNotFoundError:
+        wal = (0, 0)
+
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino, *wal)
+
+
+def modified_ns(fingerprint):
+    """the last modification of a file, or its write-ahead log, from its fingerprint"""
+    return max(fingerprint[0], fingerprint[3])
+
+
+def stat_key(path):
+    """a freshness key for a file: its resolved path and ``fingerprint``
+
+    returns ``None`` if the file does not exist
+    """
+    path = Path(path).resolve()
+    found = fingerprint(path)
+    return None if found is None else (str(path), found)
+
+
+def index_key(key):
+    """the value which must match for a sidecar index to be reused"""
+    return repr((INDEX_VERSION, key))
+
+
+def private_dir(path, shared=False):
+    """create a directory, if missing, only usable by this user, or its group if
+    ``shared``
+
+    raises ``PermissionError`` if it exists, but is writable by others, or (unless
+    ``shared``) is owned by another user, or writable by its group
+    """
+    path = Path(path)
+    created = not path.exists()
+    path.mkdir(mode=DIR_MODES[shared], parents=True, exist_ok=True)
+
+    if created and shared:
+        # the umask usually takes away the group's write
+        path.chmod(DIR_MODES[shared])
+
+    path_stat = path.stat()
+    writable = S_IWOTH if shared else S_IWGRP | S_IWOTH
+
+    if not S_ISDIR(path_stat.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+
+    if path_stat.st_mode & writable:
+        raise PermissionError(f"{path} is writable by other users")
+
+    if not shared and hasattr(os, "getuid") and path_stat.st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by another user")
+
+    return path
+
+
+@contextmanager
+def atomic_write(path, shared=False):
+    """yield a temporary path, in a ``private_dir`` beside ``path``, which is
+    moved to ``path`` if nothing is raised, and otherwise removed
+    """
+    path = Path(path)
+    private_dir(path.parent, shared)
+    tmp_path = path.parent / f".{path.name}.{uuid.uuid4().hex}.tmp"
+
+    try:
+        yield tmp_path
+        if shared:
+            tmp_path.chmod(FILE_MODES[shared])
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.exists() and tmp_path.unlink()
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """hold an exclusive ``flock`` on a file, created if missing, where available
+
+    the file is opened read-only, so users in a ``shared`` group may all lock it
+    """
+    if fcntl is None:  # pragma: no cover
+        yield
+        return
+
+    fd = os.open(path, os.O_RDONLY | os.O_CREAT, FILE_MODES[shared])
+
+    try:
+        if os.fstat(fd).st_uid == os.getuid():
+            os.fchmod(fd, FILE_MODES[shared])
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def content_hash(path):
+    """the sha256 hex digest of the contents of a file, then of its write-ahead log,
+    if any, read in chunks
+    """
+    path = Path(path)
+    sha = hashlib.sha256()
+
+    for part in [path, path.parent / (path.name + WAL_SUFFIX)]:
+        try:
+            with open(part, "rb") as fp:
+                for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+        except FileNotFoundError:
+            if part == path:
+                raise
+
+    return sha.hexdigest()
+
+
+def digest(value):
+    """a short, filesystem-safe hash of the ``repr`` of a value"""
+    return hashlib.sha256(repr(value).encode("utf-8")).hexdigest()[:32]
+
+
+class LRUCache:
+    """a least-recently-used mapping, bounded by entry count and estimated bytes
+
+    a ``max_entries`` or ``max_bytes`` of ``0`` disables the cache
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        """iterate over a snapshot of the keys, without marking them as used"""
+        return iter([*self._entries])
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        self.pop(key)
+
+        if nbytes > self.max_bytes or not self.max_entries:
+            return
+
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        self.trim()
+
+    def trim(self):
+        """evict the least-recently-used entries until within the limits"""
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.nbytes > self.max_bytes
+        ):
+            self._evict(next(iter(self._entries)))
+
+    def pop(self, key, default=None):
+        if key not in self._entries:
+            return default
+        return self._evict(key)
+
+    def discard(self, predicate):
+        """drop all entries with keys matching ``predicate``"""
+        for key in [k for k in self._entries if predicate(k)]:
+            self._evict(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def _evict(self, key):
+        value, nbytes = self._entries.pop(key)
+        self.nbytes -= nbytes
+        return value
+
+
+class DiskCache:
+    """a directory of files, bounded by total bytes, evicting the least-recently-used
+
+    a file's modification time is its last use. Files are written to a temporary
+    name, then atomically moved into place. The directory must be private, unless
+    ``shared``, as in ``private_dir``, when files are also writable by its group.
+    """
+
+    def __init__(self, path, max_bytes, shared=False):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.shared = shared
+
+    def get(self, name):
+        """the path to a cached file, or ``None``"""
+        path = self.path / name
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except PermissionError:
+            # written by another user of a shared cache: use it, but don't touch it
+            pass
+        private_dir(self.path, self.shared)
+        return path
+
+    def put(self, name, source):
+        """copy a readable binary file object into the cache, in chunks"""
+        path = self.path / name
+
+        with atomic_write(path, self.shared) as tmp_path, tmp_path.open("wb") as dest:
+            shutil.copyfileobj(source, dest, CHUNK_SIZE)
+
+        self.trim(keep=[name])
+        return path
+
+    def discard(self, prefix, keep=()):
+        """remove files starting with ``prefix``, except those in ``keep``"""
+        for path in self._files():
+            if path.name.startswith(prefix) and path.name not in keep:
+                self._unlink(path)
+
+    def trim(self, keep=()):
+        """remove the least-recently-used files until within ``max_bytes``"""
+        stats = []
+
+        for path in self._files():
+            try:
+                stats += [(path.stat(), path)]
+            except FileNotFoundError:
+                continue
+
+        total = sum(stat.st_size for stat, path in stats)
+
+        for stat, path in sorted(stats, key=lambda sp: sp[0].st_mtime_ns):
+            if total <= self.max_bytes:
+                break
+            if path.name in keep:
+                continue
+            self._unlink(path)
+            total -= stat.st_size
+
+    def _files(self):
+        if not self.path.is_dir():
+            return []
+        return [p for p in self.path.iterdir() if not p.name.startswith(".")]
+
+    def _unlink(self, path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class PayloadCache(DiskCache):
+    """a directory of serialized payloads, maybe compressed, which may be shared by
+    many processes
+
+    building a payload holds an exclusive ``flock`` on one of a few lock files,
+    chosen by its name, so concurrent processes build each payload once
+    """
+
+    def __init__(self, path, max_bytes, compression=None, shared=False):
+        super().__init__(path, max_bytes, shared)
+        self.compression = compression
+
+    def get_bytes(self, name):
+        """the (decompressed) bytes of a payload, or ``None``"""
+        path = self.get(self._filename(name))
+
+        try:
+            data = path and path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        if data and self.compression:
+            return decompress(self.compression, data)
+
+        return data
+
+    def put_bytes(self, name, data):
+        """write the (maybe compressed) bytes of a payload, atomically"""
+        if self.compression:
+            data = compress(self.compression, data)
+        self.put(self._filename(name), io.BytesIO(data))
+
+    @contextmanager
+    def lock(self, name):
+        """hold the exclusive lock for a payload, where ``flock`` is available"""
+        private_dir(self.path, self.shared)
+        stripe = int(digest(name), 16) % LOCK_STRIPES
+
+        with file_lock(self.path / f".lock-{stripe}", self.shared):
+            yield
+
+    def _filename(self, name):
+        return f"{name}.{self.compression}" if self.compression else name
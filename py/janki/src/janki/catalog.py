@@ -0,0 +1,96 @@
+"""a catalog of the collections under a directory, with a summary of each"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import json
+import os
+from pathlib import Path
+
+from .cache import atomic_write, fingerprint, modified_ns
+from .constants import EXTENSIONS
+from .write import has_table
+
+#: bump to resummarize all collections in existing catalogs
+CATALOG_VERSION = 1
+
+# newer collections have a `decks` table, with hierarchical names separated by this
+DECK_SEPARATOR = "\x1f"
+
+
+def scan(root_path):
+    """find the collections under a directory, skipping hidden files and folders
+
+    returns their ``/``-separated paths, mapped to their ``fingerprint`` (as in
+    ``cache.fingerprint``), last ``mtime`` in seconds and ``size``
+    """
+    root_path = Path(root_path)
+    suffixes = {f".{ext}" for ext in EXTENSIONS}
+    found = {}
+
+    for dirpath, dirnames, filenames in os.walk(root_path):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+
+        for filename in filenames:
+            path = Path(dirpath) / filename
+
+            if filename.startswith(".") or path.suffix not in suffixes:
+                continue
+
+            stat = fingerprint(path)
+
+            if stat is None:
+                continue
+
+            found[path.relative_to(root_path).as_posix()] = {
+                "fingerprint": [*stat],
+                "mtime": modified_ns(stat) // 10**9,
+                "size": stat[1],
+            }
+
+    return found
+
+
+def deck_names(db):
+    """the sorted names of the decks of an open collection"""
+    if has_table(db, "decks"):
+        names = [
+            name.replace(DECK_SEPARATOR, "::")
+            for (name,) in db.execute("SELECT name FROM decks;")
+        ]
+    else:
+        (decks,) = db.execute("SELECT decks FROM col;").fetchone()
+        names = [deck["name"] for deck in json.loads(decks or "{}").values()]
+
+    return sorted(names)
+
+
+def summarize(db):
+    """count the cards, notes and reviews of an open collection, and name its decks"""
+    cards, notes, revlog = db.execute(
+        "SELECT (SELECT COUNT(*) FROM cards), (SELECT COUNT(*) FROM notes), "
+        "(SELECT COUNT(*) FROM revlog);"
+    ).fetchone()
+    return {"cards": cards, "notes": notes, "revlog": revlog, "decks": deck_names(db)}
+
+
+def read(catalog_path, root):
+    """the entries of a persisted catalog of ``root``, or none if it is missing,
+    unreadable, or from another version
+    """
+    try:
+        catalog = json.loads(Path(catalog_path).read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+    if catalog.get("version") != CATALOG_VERSION or catalog.get("root") != root:
+        return {}
+
+    return catalog.get("collections", {})
+
+
+def write(catalog_path, root, entries):
+    """persist the entries of a catalog, atomically"""
+    catalog = {"version": CATALOG_VERSION, "root": root, "collections": entries}
+
+    with atomic_write(catalog_path) as tmp_path:
+        tmp_path.write_text(json.dumps(catalog), encoding="utf-8")
@@ -0,0 +1,54 @@
+"""compression of payloads and responses, some of which need optional dependencies"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import functools
+import gzip
+import importlib.util
+
+#: compression codecs, by their HTTP content-coding, and the module they need, if any
+CODECS = dict(gzip=None, br="brotli", zstd="zstandard")
+
+#: the default level of each codec, favoring speed over size
+LEVELS = dict(gzip=5, br=5, zstd=3)
+
+
+@functools.lru_cache(maxsize=None)
+def available(codec):
+    """whether a codec is known, and its module can be imported"""
+    if codec not in CODECS:
+        return False
+    module = CODECS[codec]
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def compress(codec, data, level=None):
+    level = LEVELS[codec] if level is None else level
+
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == "br":
+        import brotli
+
+        return brotli.compress(data, quality=level)
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    raise ValueError(f"{codec} is not one of {', '.join(CODECS)}")
+
+
+def decompress(codec, data):
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "br":
+        import brotli
+
+        return brotli.decompress(data)
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    raise ValueError(f"{codec} is not one of {', '.join(CODECS)}")
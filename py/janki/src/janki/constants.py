@@ -6,3 +6,22 @@ EXTENSIONS = ["anki2", "apkg"]
 RE_EXT = f"\.({'|'.join(EXTENSIONS)})"
 TABLE_NAMES = ["cards", "col", "notes", "revlog"]
 JSON_FIELDS = dict(col=["conf", "dconf", "decks", "tags", "models"])
+# the column which records when a row changed, and its units per second
+CHANGE_COLUMNS = dict(
+    cards=("mod", 1), col=("mod", 1000), notes=("mod", 1), revlog=("id", 1000)
+)
+# the tables whose deletions are recorded in `graves`, by `graves.type`
+GRAVE_TYPES = dict(cards=0, notes=1)
+CHUNK_SIZE = 1024 * 1024
+# the shapes of collection responses: tables of rows keyed by id, or columns and rows
+FORMATS = dict(objects="api-collection", columnar="api-columnar-collection")
+# the encodings of collection responses, by name: their media type, and the module
+# they need, if any
+ENCODINGS = dict(
+    json=("application/json", None),
+    msgpack=("application/msgpack", "msgpack"),
+    arrow=("application/vnd.apache.arrow.stream", "pyarrow"),
+)
+ARROW_BATCH_ROWS = 64 * 1024
+# the member of a `.apkg` which maps the numbered members to media file names
+APKG_MEDIA_JSON = "media"
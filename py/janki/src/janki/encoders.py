@@ -0,0 +1,90 @@
+"""binary encodings of collection responses, which need optional dependencies"""
+
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import functools
+import importlib.util
+
+from .constants import ENCODINGS
+
+
+@functools.lru_cache(maxsize=None)
+def available(encoding):
+    """whether an encoding is known, and its module can be imported"""
+    if encoding not in ENCODINGS:
+        return False
+    module = ENCODINGS[encoding][1]
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def encode_msgpack(response):
+    """encode a collection response as ``msgpack``, with ids as strings, as in JSON"""
+    import msgpack
+
+    return msgpack.packb(
+        {
+            key: (
+                {str(k): v for k, v in value.items()}
+                if isinstance(value, dict)
+                else value
+            )
+            for key, value in response.items()
+        }
+    )
+
+
+def arrow_type(sqlite_types):
+    """the Arrow type which can hold all of the SQLite ``typeof`` a column"""
+    import pyarrow as pa
+
+    for sqlite_type, arrow_type in [
+        ("blob", pa.binary()),
+        ("text", pa.string()),
+        ("real", pa.float64()),
+        ("integer", pa.int64()),
+    ]:
+        if sqlite_type in sqlite_types:
+            return arrow_type
+
+    return pa.null()
+
+
+def encode_arrow(cur, sqlite_types, batch_rows):
+    """encode the rows of a cursor as an Arrow IPC stream, ``batch_rows`` at a time
+
+    ``sqlite_types`` are the sets of SQLite types found in each column, e.g. anki
+    stores numeric-looking ``notes.sfld`` as integers: these are cast to text.
+    JSON fields are left as text.
+    """
+    import pyarrow as pa
+
+    names = [d[0] for d in cur.description]
+    schema = pa.schema([(n, arrow_type(t)) for n, t in zip(names, sqlite_types)])
+    casts = [
+        str if field.type == pa.string() and types - {"text", "null"} else None
+        for field, types in zip(schema, sqlite_types)
+    ]
+    sink = pa.BufferOutputStream()
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        while True:
+            rows = cur.fetchmany(batch_rows)
+
+            if not rows:
+                break
+
+            columns = [*zip(*rows)]
+
+            for i, cast in enumerate(casts):
+                if cast is not None:
+                    columns[i] = [None if v is None else cast(v) for v in columns[i]]
+
+            writer.write_batch(
+                pa.RecordBatch.from_arrays(
+                    [pa.array(c, f.type) for c, f in zip(columns, schema)],
+                    schema=schema,
+                )
+            )
+
+    return sink.getvalue().to_pybytes()
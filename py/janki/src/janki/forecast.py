@@ -0,0 +1,96 @@
+"""forecast the daily review load of a collection, with SM-2-style scheduling
+simulated for all cards at once
+"""
+
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import itertools
+
+import numpy as np
+
+#: the ``cards`` columns read for the simulation
+COLUMNS = ["queue", "due", "ivl", "factor"]
+
+#: ``cards.queue`` values
+NEW, LEARN, REVIEW, DAY_LEARN = 0, 1, 2, 3
+
+#: the starting ease of cards without one, and the lowest ease, in permille
+DEFAULT_FACTOR = 2500
+MIN_FACTOR = 1300
+
+#: the ease lost on a lapse, in permille
+LAPSE_FACTOR = 200
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def read_cards(db):
+    """read the scheduling columns of all cards as ``int64`` arrays"""
+    cur = db.execute(f"SELECT {', '.join(COLUMNS)} FROM cards;")
+    flat = np.fromiter(itertools.chain.from_iterable(cur), dtype=np.int64)
+    return dict(zip(COLUMNS, flat.reshape(-1, len(COLUMNS)).T))
+
+
+def today(db, now):
+    """the collection's day number at unix time ``now``, from its creation time"""
+    (crt,) = db.execute("SELECT crt FROM col;").fetchone()
+    return int(now - crt) // SECONDS_PER_DAY
+
+
+def simulate(
+    queue, due, ivl, factor, today, days, retention=0.9, new_per_day=20, seed=0
+):
+    """count the reviews, and new cards introduced, on each of the next ``days``
+
+    every card due in the horizon is reviewed, in generations: a card passes with
+    probability ``retention``, growing its interval by its ease, or lapses,
+    resetting its interval to a day and losing ease. New cards are introduced in
+    ``due`` order, ``new_per_day`` at a time. Suspended and buried cards are
+    never due.
+    """
+    rng = np.random.default_rng(seed)
+    queue = np.asarray(queue)
+    due = np.asarray(due, dtype=np.int64)
+
+    review = (queue == REVIEW) | (queue == DAY_LEARN)
+    learning = queue == LEARN
+    new = np.flatnonzero(queue == NEW)
+
+    # the day (from today) each card is next due, `days` if beyond the horizon
+    next_due = np.full(queue.shape, days, dtype=np.int64)
+    next_due[review] = np.clip(due[review] - today, 0, days)
+    next_due[learning] = 0
+
+    if new_per_day > 0:
+        new = new[np.argsort(due[new], kind="stable")]
+        next_due[new] = np.minimum(np.arange(new.size) // new_per_day, days)
+
+    introduced = np.bincount(next_due[new], minlength=days + 1)[:days]
+
+    ivl = np.where(review, np.maximum(ivl, 1), 0).astype(np.float64)
+    factor = np.where(np.asarray(factor) > 0, factor, DEFAULT_FACTOR).astype(np.float64)
+    reviews = np.zeros(days, dtype=np.int64)
+    active = np.flatnonzero(next_due < days)
+
+    while active.size:
+        day = next_due[active]
+        reviews += np.bincount(day, minlength=days)
+
+        passed = rng.random(active.size) < retention
+        card_ivl = ivl[active]
+        card_factor = factor[active]
+
+        card_ivl = np.where(
+            passed,
+            np.maximum(card_ivl + 1, np.floor(card_ivl * card_factor / 1000)),
+            1,
+        )
+        factor[active] = np.where(
+            passed, card_factor, np.maximum(MIN_FACTOR, card_factor - LAPSE_FACTOR)
+        )
+        ivl[active] = card_ivl
+        next_due[active] = day + card_ivl.astype(np.int64)
+        active = active[next_due[active] < days]
+
+    return {"reviews": reviews.tolist(), "new": introduced.tolist()}
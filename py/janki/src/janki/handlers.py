@@ -2,36 +2,504 @@
 # Copyright (c) 2021 University System of Georgia and janki contributors
 # Distributed under the terms of the BSD-3-Clause License.
 
+import functools
+import mimetypes
+from contextlib import AsyncExitStack
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+
 from jupyter_server.base.handlers import APIHandler
 from jupyter_server.utils import url_path_join as ujoin
-from tornado.web import authenticated
+from tornado.web import HTTPError, authenticated
 
-from .constants import API_NS, RE_EXT
+from . import compression
+from ._version import __version__
+from .cache import digest, modified_ns, stat_key
+from .constants import API_NS, ENCODINGS, RE_EXT, TABLE_NAMES
+from .encoders import available
 
 
 class HandlerBase(APIHandler):
     """common concerns for all our handlers"""
 
+    #: the query arguments which change the response body, for its ``Etag``
+    etag_arguments = []
+
+    #: the request headers which change the response body, for ``Vary``
+    vary = ["Accept-Encoding"]
+
     def initialize(self, manager):
         self.manager = manager
+        self.content_coding = None
+
+        if self.vary:
+            self.set_header("Vary", ", ".join(self.vary))
+
+        if "Accept-Encoding" in self.vary:
+            self.content_coding = self.get_content_coding()
+
+    def get_content_coding(self):
+        """the most-preferred available content-coding in ``Accept-Encoding``, with
+        ties going to the first of the manager's ``response_codings``, or ``None``
+        """
+        codings = [c for c in self.manager.response_codings if compression.available(c)]
+        quality = {}
+
+        for part in self.request.headers.get("Accept-Encoding", "").split(","):
+            coding, *params = [p.strip().lower() for p in part.split(";")]
+            quality[coding] = 1.0
+            for param in params:
+                name, _, value = param.partition("=")
+                if name.strip() == "q":
+                    try:
+                        quality[coding] = float(value)
+                    except ValueError:
+                        quality[coding] = 0
+
+        accepted = [
+            (-quality.get(c, quality.get("*", 0)), i, c) for i, c in enumerate(codings)
+        ]
+        accepted = [a for a in accepted if a[0] < 0]
+
+        return min(accepted)[-1] if accepted else None
+
+    def etag_variant(self):
+        return [(name, self.get_arguments(name)) for name in self.etag_arguments]
+
+    def check_not_modified(self, path):
+        """set validators for a response derived from a file, and return whether the
+        client's copy is still fresh, without reading the file
+
+        the strong ``Etag`` is derived from the file's freshness, the arguments which
+        change the response, and the server version
+        """
+        key = stat_key(self.manager.root_path / path)
+
+        if key is None:
+            return False
+
+        modified = datetime.fromtimestamp(modified_ns(key[1]) // 10**9, timezone.utc)
+        etag = digest((key, self.etag_variant(), self.content_coding, __version__))
+        self.set_header("Etag", f'"{etag}"')
+        self.set_header("Last-Modified", modified)
+        self.set_header("Cache-Control", "no-cache")
+
+        if self.request.headers.get("If-None-Match"):
+            return self.check_etag_header()
+
+        since = self.request.headers.get("If-Modified-Since")
+
+        try:
+            return bool(since) and modified <= parsedate_to_datetime(since)
+        except (TypeError, ValueError):
+            return False
+
+    async def finish_json(self, response):
+        """finish with a response encoded by the manager's ``serializer``"""
+        await self.finish(self.manager.serializer.dumpb(response))
+
+    async def encode_json(self, path, load):
+        """encode the response from awaiting ``load()``, derived from the file at
+        ``path``, in the negotiated content-coding
+
+        compressed bodies are cached with the manager's responses, so each is only
+        compressed once per version of the file
+        """
+        if self.content_coding is None:
+            return self.manager.serializer.dumpb(await load())
+
+        variant = digest((self.request.path, self.etag_variant()))
+        coding, body = await self.manager.compressed(
+            path, variant, self.content_coding, load
+        )
+
+        if coding is not None:
+            self.set_header("Content-Encoding", coding)
+
+        return body
+
+    async def finish_not_modified(self):
+        self.set_status(304)
+        await self.finish()
+
+    def get_bool_argument(self, name, default=False):
+        value = self.get_argument(name, None)
+        if value is None:
+            return default
+        return value.lower() not in ["", "0", "false", "no"]
+
+    def get_list_argument(self, name):
+        """get all the comma-separated values of (maybe repeated) arguments"""
+        return [v for arg in self.get_arguments(name) for v in arg.split(",") if v]
+
+    async def stream(self, chunks):
+        """write and flush chunks of a JSON response as they are produced"""
+        self.set_header("Content-Type", "application/json")
+        try:
+            async for chunk in chunks:
+                self.write(chunk)
+                await self.flush()
+        finally:
+            await chunks.aclose()
+        await self.finish()
 
 
 class CollectionHandler(HandlerBase):
     """work with data about a collection. It might be stored in an `.apkg` or `.anki2`"""
 
+    etag_arguments = ["tables", "fields", "stream", "format"]
+
+    vary = ["Accept", "Accept-Encoding"]
+
+    def etag_variant(self):
+        return [*super().etag_variant(), self.manager.stream_responses, self.encoding]
+
+    def get_encoding(self):
+        """the ``?encoding=``, or the most-preferred available one in ``Accept``"""
+        encoding = self.get_argument("encoding", None)
+
+        if encoding is not None:
+            if encoding not in ENCODINGS:
+                raise HTTPError(400, f"{encoding} is not one of {', '.join(ENCODINGS)}")
+            if not available(encoding):
+                raise HTTPError(406, f"{encoding} is not available")
+            return encoding
+
+        by_media_type = {media_type: e for e, (media_type, _) in ENCODINGS.items()}
+        accepted = []
+
+        for i, part in enumerate(self.request.headers.get("Accept", "").split(",")):
+            media_type, *params = [p.strip() for p in part.split(";")]
+            quality = 1.0
+            for param in params:
+                name, _, value = param.partition("=")
+                if name.strip() == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0
+            encoding = by_media_type.get(media_type)
+            if encoding and quality > 0 and available(encoding):
+                accepted += [(-quality, i, encoding)]
+
+        return min(accepted)[-1] if accepted else "json"
+
+    @authenticated
+    async def get(self, collection_path, extension):
+        self.encoding = self.get_encoding()
+
+        if self.check_not_modified(collection_path):
+            await self.finish_not_modified()
+            return
+
+        try:
+            projection = self.manager.projection(
+                self.get_list_argument("tables"), self.get_list_argument("fields")
+            )
+            fmt = self.get_argument("format", "objects")
+
+            if self.encoding != "json":
+                body = await self.manager.encode(
+                    collection_path, projection, fmt, self.encoding
+                )
+                await self.finish(body, set_content_type=ENCODINGS[self.encoding][0])
+                return
+
+            if self.get_bool_argument("stream", self.manager.stream_responses):
+                await self.stream(self.manager.stream(collection_path, projection, fmt))
+                return
+
+            body = await self.encode_json(
+                collection_path,
+                functools.partial(self.manager.load, collection_path, projection, fmt),
+            )
+        except ValueError as err:
+            raise HTTPError(400, str(err))
+
+        await self.finish(body)
+
+    @authenticated
+    async def post(self, collection_path, extension):
+        """insert and update ``notes`` and ``cards``, in one transaction"""
+        try:
+            body = self.manager.serializer.loads(self.request.body or b"{}")
+
+            if not isinstance(body, dict):
+                raise ValueError("expected an object with notes and cards")
+
+            response = await self.manager.write(
+                collection_path, body.get("notes", []), body.get("cards", [])
+            )
+        except ValueError as err:
+            raise HTTPError(400, str(err))
+
+        await self.finish_json(response)
+
+
+class TableHandler(HandlerBase):
+    """page through one table of a collection, in the order of a sort key"""
+
+    etag_arguments = ["after", "limit", "sort"]
+
+    @authenticated
+    async def get(self, collection_path, extension, table_name):
+        if self.check_not_modified(collection_path):
+            await self.finish_not_modified()
+            return
+
+        limit = self.get_argument("limit", None)
+
+        try:
+            body = await self.encode_json(
+                collection_path,
+                functools.partial(
+                    self.manager.page,
+                    collection_path,
+                    table_name,
+                    after=self.get_argument("after", None),
+                    limit=int(limit) if limit else None,
+                    sort=self.get_argument("sort", "id"),
+                ),
+            )
+        except ValueError as err:
+            raise HTTPError(400, str(err))
+
+        await self.finish(body)
+
+
+class ChangesHandler(HandlerBase):
+    """get the rows of a collection changed since a watermark, and deleted ids"""
+
+    etag_arguments = ["since", "tables", "fields"]
+
     @authenticated
     async def get(self, collection_path, extension):
-        response = await self.manager.load(collection_path)
-        await self.finish(response)
+        if self.check_not_modified(collection_path):
+            await self.finish_not_modified()
+            return
+
+        try:
+            projection = self.manager.projection(
+                self.get_list_argument("tables"), self.get_list_argument("fields")
+            )
+            body = await self.encode_json(
+                collection_path,
+                functools.partial(
+                    self.manager.changes,
+                    collection_path,
+                    int(self.get_argument("since", 0)),
+                    projection,
+                ),
+            )
+        except ValueError as err:
+            raise HTTPError(400, str(err))
+
+        await self.finish(body)
+
+
+class SearchHandler(HandlerBase):
+    """full-text search the fields and tags of the notes of a collection"""
+
+    etag_arguments = ["q", "limit"]
+
+    @authenticated
+    async def get(self, collection_path, extension):
+        if self.check_not_modified(collection_path):
+            await self.finish_not_modified()
+            return
+
+        limit = self.get_argument("limit", None)
+
+        try:
+            body = await self.encode_json(
+                collection_path,
+                functools.partial(
+                    self.manager.search,
+                    collection_path,
+                    self.get_argument("q"),
+                    limit=int(limit) if limit else None,
+                ),
+            )
+        except ValueError as err:
+            raise HTTPError(400, str(err))
+
+        await self.finish(body)
+
+
+class QueryHandler(HandlerBase):
+    """get the cards of a collection matching a query, and their notes"""
+
+    etag_arguments = ["q", "order", "limit"]
+
+    @authenticated
+    async def get(self, collection_path, extension):
+        if self.check_not_modified(collection_path):
+            await self.finish_not_modified()
+            return
+
+        limit = self.get_argument("limit", None)
+
+        try:
+            body = await self.encode_json(
+                collection_path,
+                functools.partial(
+                    self.manager.query,
+                    collection_path,
+                    self.get_argument("q", ""),
+                    order=self.get_argument("order", "id"),
+                    limit=int(limit) if limit else None,
+                ),
+            )
+        except ValueError as err:
+            raise HTTPError(400, str(err))
+
+        await self.finish(body)
+
+
+class StatsHandler(HandlerBase):
+    """get the review statistics of a collection"""
+
+    @authenticated
+    async def get(self, collection_path, extension):
+        if self.check_not_modified(collection_path):
+            await self.finish_not_modified()
+            return
+
+        try:
+            body = await self.encode_json(
+                collection_path, functools.partial(self.manager.stats, collection_path)
+            )
+        except ValueError as err:
+            raise HTTPError(400, str(err))
+
+        await self.finish(body)
+
+
+class ForecastHandler(HandlerBase):
+    """simulate the daily reviews of a collection over the coming days"""
+
+    etag_arguments = ["days", "retention", "new", "seed"]
+
+    def etag_variant(self):
+        # forecasts start from today
+        return [*super().etag_variant(), date.today().isoformat()]
+
+    @authenticated
+    async def get(self, collection_path, extension):
+        if self.check_not_modified(collection_path):
+            await self.finish_not_modified()
+            return
+
+        try:
+            days = self.get_argument("days", None)
+            body = await self.encode_json(
+                collection_path,
+                functools.partial(
+                    self.manager.forecast,
+                    collection_path,
+                    days=int(days) if days else None,
+                    retention=float(self.get_argument("retention", 0.9)),
+                    new_per_day=int(self.get_argument("new", 20)),
+                    seed=int(self.get_argument("seed", 0)),
+                ),
+            )
+        except ValueError as err:
+            raise HTTPError(400, str(err))
+
+        await self.finish(body)
+
+
+class CatalogHandler(HandlerBase):
+    """list the collections under the root directory, with a summary of each
+
+    the catalog is as last scanned: it is rescanned in the background when stale
+    """
+
+    vary = []
+
+    @authenticated
+    async def get(self):
+        self.set_header("Cache-Control", "no-cache")
+        await self.finish_json(await self.manager.catalog())
 
 
 class PackageHandler(HandlerBase):
-    """return the named file from the package"""
+    """stream a media file from a ``.apkg``, by its name, with ``Range`` support"""
+
+    vary = []
+
+    def etag_variant(self):
+        return self.media
 
     @authenticated
-    async def get(self, path):
-        response = await self.manager.get_static(path)
-        await self.finish(response)
+    async def get(self, apkg_path, extension, name):
+        async with AsyncExitStack() as stack:
+            try:
+                fp, info = await stack.enter_async_context(
+                    self.manager.open_media(apkg_path, name)
+                )
+            except (KeyError, ValueError):
+                raise HTTPError(404, f"{name} is not in {apkg_path}")
+
+            self.media = [name, info.CRC]
+
+            if self.check_not_modified(apkg_path):
+                await self.finish_not_modified()
+                return
+
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            size = info.file_size
+            start, end = 0, size
+            self.set_header("Accept-Ranges", "bytes")
+
+            try:
+                byte_range = parse_range(self.request.headers.get("Range"), size)
+            except ValueError:
+                self.set_status(416)
+                self.set_header("Content-Range", f"bytes */{size}")
+                await self.finish(set_content_type=content_type)
+                return
+
+            if byte_range is not None:
+                start, end = byte_range
+                self.set_status(206)
+                self.set_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+
+            self.set_header("Content-Length", end - start)
+            self.set_header("Content-Type", content_type)
+
+            async for chunk in self.manager.read_chunks(fp, start, end):
+                self.write(chunk)
+                await self.flush()
+
+        await self.finish(set_content_type=content_type)
+
+
+def parse_range(header, size):
+    """parse a single ``bytes`` range of a ``Range`` header as ``(start, end)``
+
+    returns ``None`` to ignore the header, and raises ``ValueError`` if the range
+    can't be satisfied
+    """
+    unit, _, spec = (header or "").partition("=")
+
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+
+    first, dash, last = spec.strip().partition("-")
+
+    if not dash or not (first + last).isdigit():
+        return None
+
+    if not first:
+        start, end = max(size - int(last), 0), size
+    else:
+        start, end = int(first), min(int(last) + 1 if last else size, size)
+
+    if start >= end:
+        raise ValueError(f"{header} is not satisfiable")
+
+    return start, end
 
 
 def add_handlers(manager, host_pattern=".*$"):
@@ -49,7 +517,25 @@ def add_handlers(manager, host_pattern=".*$"):
         [
             # the collection handler returns schema-constrained
             (_u("collection", f"(.*{RE_EXT})"), CollectionHandler, mgr),
-            # serves static HTML, rooted to an apkg
-            (_u("package", "(.*)"), PackageHandler, mgr),
+            # pages of rows from one table of a collection
+            (
+                _u("collection", f"(.*{RE_EXT})", f"({'|'.join(TABLE_NAMES)})"),
+                TableHandler,
+                mgr,
+            ),
+            # rows changed since a watermark
+            (_u("collection", f"(.*{RE_EXT})", "changes"), ChangesHandler, mgr),
+            # full-text search of notes
+            (_u("collection", f"(.*{RE_EXT})", "search"), SearchHandler, mgr),
+            # cards matching a query, and their notes
+            (_u("collection", f"(.*{RE_EXT})", "query"), QueryHandler, mgr),
+            # aggregate review statistics
+            (_u("collection", f"(.*{RE_EXT})", "stats"), StatsHandler, mgr),
+            # simulated future reviews
+            (_u("collection", f"(.*{RE_EXT})", "forecast"), ForecastHandler, mgr),
+            # summaries of all the collections
+            (_u("catalog"), CatalogHandler, mgr),
+            # streams media files from an apkg, by name
+            (_u("package", "(.*\\.(apkg))", "(.+)"), PackageHandler, mgr),
         ],
     )
@@ -1,24 +1,62 @@
 # Copyright (c) 2021 University System of Georgia and janki contributors
 # Distributed under the terms of the BSD-3-Clause License.
 
-import json
+import asyncio
+import functools
+import os
 import sqlite3
-import tempfile
-from concurrent.futures import ThreadPoolExecutor
+import time
+import weakref
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager
 from pathlib import Path
 
 import jsonschema
-from tornado.concurrent import run_on_executor
-from traitlets import Bool, Instance, Unicode, default
+from tornado.ioloop import IOLoop
+from traitlets import (
+    Bool,
+    Enum,
+    Float,
+    Instance,
+    Int,
+    List,
+    TraitError,
+    Type,
+    Unicode,
+    Union,
+    default,
+    observe,
+    validate,
+)
 from traitlets.config import LoggingConfigurable
 
-from .constants import JSON_FIELDS, TABLE_NAMES
-from .schema import make_validator
+from . import compression
+from .cache import LRUCache, stat_key
+from .compression import CODECS
+from .constants import CHUNK_SIZE, FORMATS
+from .encoders import available, encode_msgpack
+from .schema import CompiledValidator, make_validator
+from .serializers import JSONSerializer, default_serializer_class
+from .store import CollectionStore, check_format, make_projection
+from .watcher import PollingWatcher, WatchdogWatcher, has_watchdog
+
+#: traits which configure the ``CollectionStore``
+STORE_TRAITS = [
+    "root_dir",
+    "cache_dir",
+    "extract_cache_max_bytes",
+    "apkg_strategy",
+    "memory_max_bytes",
+    "serializer",
+    "payload_cache_dir",
+    "payload_cache_max_bytes",
+    "payload_compression",
+    "payload_cache_shared",
+]
 
 
 class JankiManager(LoggingConfigurable):
-    executor = ThreadPoolExecutor(max_workers=1)
-
     strict = Bool(
         help="apply strict validation to all outputs in addition to inputs"
     ).tag(config=True)
@@ -31,7 +69,251 @@ class JankiManager(LoggingConfigurable):
         True, help="whether to add the `janki_manager` trait to the parent"
     ).tag(config=True)
 
-    validator = Instance(jsonschema.Draft7Validator)
+    cache_max_entries = Int(
+        32, help="the maximum number of collection responses to keep in memory"
+    ).tag(config=True)
+
+    cache_max_bytes = Int(
+        256 * 1024 * 1024,
+        help=(
+            "the approximate maximum bytes of collection responses to keep in "
+            "memory, as estimated from the size of their collection files"
+        ),
+    ).tag(config=True)
+
+    stream_responses = Bool(
+        False,
+        help=(
+            "whether to stream collection responses as chunked JSON, rather than "
+            "(caching) whole responses. May be overridden with `?stream=`"
+        ),
+    ).tag(config=True)
+
+    stream_chunk_rows = Int(
+        1000, help="the number of rows to encode in each chunk of a streamed response"
+    ).tag(config=True)
+
+    response_codings = List(
+        Unicode(),
+        ["zstd", "br", "gzip"],
+        help=(
+            "the content-codings which JSON responses may be compressed with, if "
+            "installed and accepted by the client, most-preferred first"
+        ),
+    ).tag(config=True)
+
+    compress_min_bytes = Int(
+        1024, help="the smallest JSON response to compress, in bytes"
+    ).tag(config=True)
+
+    page_limit = Int(100, help="the default number of rows in a page of a table").tag(
+        config=True
+    )
+
+    page_max_limit = Int(
+        10000, help="the maximum number of rows a client may request in a page"
+    ).tag(config=True)
+
+    forecast_days = Int(30, help="the default number of days to forecast").tag(
+        config=True
+    )
+
+    forecast_max_days = Int(
+        10 * 365, help="the maximum number of days a client may forecast"
+    ).tag(config=True)
+
+    search_limit = Int(20, help="the default number of notes in search results").tag(
+        config=True
+    )
+
+    catalog_prewarm = Bool(
+        True,
+        help="whether to catalog the collections in `root_dir` when the server starts",
+    ).tag(config=True)
+
+    catalog_max_age = Int(
+        60,
+        help=(
+            "the seconds after which a request for the catalog starts rescanning "
+            "`root_dir`, in the background"
+        ),
+    ).tag(config=True)
+
+    catalog_max_workers = Int(
+        1, help="the number of collections to summarize at once, for the catalog"
+    ).tag(config=True)
+
+    watch = Bool(
+        False,
+        help=(
+            "whether to watch `root_dir` for changed collections, to drop and rewarm "
+            "their cached responses, extracted copies and indexes"
+        ),
+    ).tag(config=True)
+
+    watcher_kind = Enum(
+        ["auto", "watchdog", "poll"],
+        "auto",
+        help=(
+            "how to watch `root_dir`: with filesystem events from `watchdog` (e.g. "
+            "inotify), by polling, or `auto` for `watchdog` if installed"
+        ),
+    ).tag(config=True)
+
+    watch_interval = Float(
+        2.0, help="the seconds between scans of `root_dir`, when polling"
+    ).tag(config=True)
+
+    watch_debounce = Float(
+        1.0,
+        help=(
+            "the seconds a changed collection must go without further changes "
+            "before its caches are rewarmed, e.g. while being saved"
+        ),
+    ).tag(config=True)
+
+    cache_dir = Unicode(
+        help=(
+            "a local directory for files derived from collections, e.g. extractions. "
+            "It must be owned by, and only writable by, this user. Defaults to "
+            "`janki` in `$XDG_CACHE_HOME`, or `~/.cache`"
+        )
+    ).tag(config=True)
+
+    extract_cache_max_bytes = Int(
+        2 * 1024 * 1024 * 1024,
+        help=(
+            "the maximum total bytes of collections extracted from `.apkg` archives "
+            "to keep in `cache_dir`. Larger collections are extracted per request."
+        ),
+    ).tag(config=True)
+
+    payload_cache_dir = Unicode(
+        help=(
+            "a local directory for serialized collection responses, kept by the hash "
+            "of their contents. Defaults to `payloads` in `cache_dir`"
+        )
+    ).tag(config=True)
+
+    payload_cache_shared = Bool(
+        False,
+        help=(
+            "whether `payload_cache_dir` is shared by the servers of many users. "
+            "It may then be owned by, and writable by, its group, whose members "
+            "must all be trusted: any of them can change the responses of others"
+        ),
+    ).tag(config=True)
+
+    payload_cache_max_bytes = Int(
+        1024 * 1024 * 1024,
+        help=(
+            "the maximum total bytes of responses to keep in `payload_cache_dir`. "
+            "0 disables the payload cache"
+        ),
+    ).tag(config=True)
+
+    payload_compression = Enum(
+        ["none", *CODECS],
+        "none",
+        help="how to compress responses in `payload_cache_dir`, if installed",
+    ).tag(config=True)
+
+    apkg_strategy = Enum(
+        ["disk", "memory"],
+        "disk",
+        help=(
+            "how to read the collection in a `.apkg`: extracted to `cache_dir`, or "
+            "deserialized into an in-memory database, if no larger than "
+            "`memory_max_bytes` (and python >=3.11)"
+        ),
+    ).tag(config=True)
+
+    memory_max_bytes = Int(
+        64 * 1024 * 1024,
+        help="the largest `.apkg` collection to deserialize into memory",
+    ).tag(config=True)
+
+    executor_kind = Enum(
+        ["thread", "process"],
+        "thread",
+        help=(
+            "whether collections are loaded in worker threads or processes. "
+            "Streamed responses always use threads"
+        ),
+    ).tag(config=True)
+
+    max_workers = Int(
+        4, help="the number of workers for loading collections, in parallel"
+    ).tag(config=True)
+
+    max_path_workers = Int(
+        1, help="the number of workers which may work on the same collection at once"
+    ).tag(config=True)
+
+    validation_engine = Enum(
+        ["compiled", "jsonschema"],
+        "compiled",
+        help=(
+            "how `strict` validation is done: with python compiled from the schema "
+            "once, checking each table and row, or with `jsonschema`"
+        ),
+    ).tag(config=True)
+
+    validation_sample = Int(
+        0,
+        help=(
+            "if not 0, the approximate number of rows of each table to validate, "
+            "with the `compiled` engine"
+        ),
+    ).tag(config=True)
+
+    validation_structural = Bool(
+        False,
+        help=(
+            "whether to only validate the response and its tables, and not their "
+            "rows, with the `compiled` engine"
+        ),
+    ).tag(config=True)
+
+    serializer_class = Type(
+        klass=JSONSerializer,
+        help=(
+            "the class which encodes responses as, and decodes fields from, JSON. "
+            "Defaults to `orjson`, if installed"
+        ),
+    ).tag(config=True)
+
+    serializer = Instance(JSONSerializer)
+
+    validator = Union(
+        [Instance(CompiledValidator), Instance(jsonschema.Draft7Validator)]
+    )
+
+    columnar_validator = Union(
+        [Instance(CompiledValidator), Instance(jsonschema.Draft7Validator)]
+    )
+
+    cache = Instance(LRUCache)
+
+    store = Instance(CollectionStore)
+
+    executor = Instance(Executor)
+
+    thread_executor = Instance(ThreadPoolExecutor)
+
+    _path_limits = Instance(weakref.WeakValueDictionary, ())
+
+    _loading = Instance(dict, ())
+
+    _catalog = Instance(dict, allow_none=True)
+
+    _catalog_task = Instance(asyncio.Future, allow_none=True)
+
+    _catalog_updated = Float(allow_none=True)
+
+    _watcher = Instance(object, allow_none=True)
+
+    _watch_timers = Instance(dict, ())
 
     @default("strict")
     def _default_strict(self):  # pragma: no cover
@@ -43,85 +325,561 @@ class JankiManager(LoggingConfigurable):
 
     @default("validator")
     def _default_validator(self):
-        return make_validator()
+        return self._make_validator("objects")
+
+    @default("columnar_validator")
+    def _default_columnar_validator(self):
+        return self._make_validator("columnar")
+
+    def _make_validator(self, fmt):
+        ref = f"#/definitions/{FORMATS[fmt]}"
+        if self.validation_engine == "jsonschema":
+            return make_validator(ref)
+        return CompiledValidator(
+            ref, sample=self.validation_sample, structural=self.validation_structural
+        )
+
+    @observe("validation_engine", "validation_sample", "validation_structural")
+    def _on_validation_trait(self, change):
+        self.validator = self._default_validator()
+        self.columnar_validator = self._default_columnar_validator()
+
+    @default("serializer_class")
+    def _default_serializer_class(self):
+        return default_serializer_class()
+
+    @default("serializer")
+    def _default_serializer(self):
+        return self.serializer_class()
+
+    @observe("serializer_class")
+    def _on_serializer_class(self, change):
+        self.serializer = self._default_serializer()
+
+    @default("cache")
+    def _default_cache(self):
+        return LRUCache(self.cache_max_entries, self.cache_max_bytes)
+
+    @default("cache_dir")
+    def _default_cache_dir(self):
+        cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return str(Path(cache_home) / "janki")
+
+    @validate("payload_compression")
+    def _validate_payload_compression(self, proposal):
+        if not (proposal.value == "none" or compression.available(proposal.value)):
+            raise TraitError(f"{proposal.value} needs {CODECS[proposal.value]}")
+        return proposal.value
+
+    @default("payload_cache_dir")
+    def _default_payload_cache_dir(self):
+        return str(Path(self.cache_dir) / "payloads")
+
+    @default("store")
+    def _default_store(self):
+        return CollectionStore(
+            **{t: getattr(self, t) for t in STORE_TRAITS}, log=self.log
+        )
+
+    @observe(*STORE_TRAITS)
+    def _on_store_trait(self, change):
+        self.store = self._default_store()
+        self._catalog = self._catalog_updated = None
+
+    @default("executor")
+    def _default_executor(self):
+        if self.executor_kind == "process":
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.thread_executor
+
+    @default("thread_executor")
+    def _default_thread_executor(self):
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="janki"
+        )
+
+    @observe("executor_kind", "max_workers")
+    def _on_executor_trait(self, change):
+        self.shutdown()
+        self.thread_executor = self._default_thread_executor()
+        self.executor = self._default_executor()
+
+    @observe("cache_max_entries", "cache_max_bytes")
+    def _on_cache_limits(self, change):
+        setattr(self.cache, change.name.replace("cache_", ""), change.new)
+        self.cache.trim()
 
     @property
     def root_path(self):
         # TODO: actually use contents manager API, see jupyter-starters
         return Path(self.root_dir)
 
-    @run_on_executor
-    def _load(self, contents_path):
-        """load an ``.anki2`` file (maybe from inside a ``.apkg`` archive)
-        TODO: actually use contents_manager API
-        """
-        full_contents_path = self.root_path / contents_path
+    def projection(self, tables=None, fields=None):
+        return make_projection(tables, fields)
 
-        if not full_contents_path.exists():
-            raise ValueError(f"{contents_path} not found")
+    async def _submit(self, fn, *args):
+        """run a (picklable) ``store`` method on the ``executor``"""
+        return await IOLoop.current().run_in_executor(self.executor, fn, *args)
 
-        suffix = full_contents_path.suffix
+    async def _run(self, fn, *args):
+        """run a function in a thread, e.g. those which use open SQLite cursors"""
+        return await IOLoop.current().run_in_executor(self.thread_executor, fn, *args)
 
-        if suffix == ".anki2":
-            return self._get_api_response(self.root_path / contents_path, contents_path)
-        elif suffix == ".apkg":
-            import zipp
+    @asynccontextmanager
+    async def _path_limit(self, path):
+        """limit the concurrent work on the collection at ``path``"""
+        key = str((self.root_path / path).resolve())
+        limit = self._path_limits.get(key)
 
-            zip_path = zipp.Path(str(full_contents_path))
+        if limit is None:
+            limit = self._path_limits[key] = asyncio.Semaphore(self.max_path_workers)
 
-            for member in [*zip_path.iterdir()]:
-                self.log_(f"{member.__dict__}")
-                if member.name.endswith(".anki2"):
-                    with tempfile.TemporaryDirectory() as td:
-                        tdp = Path(td)
-                        db = tdp / "collection.anki2"
-                        db.write_bytes(member.read_bytes())
-                        return self._get_api_response(db, contents_path)
+        async with limit:
+            yield
 
-        raise ValueError(f"{contents_path} was not recognized")
+    async def stream(self, path, projection=None, fmt="objects"):
+        """yield a collection response as chunks of JSON text
 
-    def _get_api_response(self, db_path, contents_path):
-        db = sqlite3.connect(db_path)
+        tables are read from the SQLite cursor ``stream_chunk_rows`` at a time, so
+        the whole response is never held in memory, or validated
+        """
+        check_format(fmt)
+        projection = projection or self.projection()
+        store = self.store
+        stack = ExitStack()
 
-        result = {"path": contents_path}
+        async with self._path_limit(path):
+            db = await self._run(stack.enter_context, store.open(path))
 
         try:
-            for table_name in TABLE_NAMES:
-                self.log_(table_name)
-                cur = db.cursor()
+            # fail before anything is written
+            await self._run(store.check_projection, db, projection)
+
+            dumps = self.serializer.dumps
+            yield f'{{"path": {dumps(path)}'
+
+            for table_name, columns in projection:
+                cur = await self._run(store.select, db, table_name, columns)
+                has_id = fmt == "objects" and store.has_id(cur)
+                sep = ""
+
+                if fmt == "columnar":
+                    columns = dumps(store.column_names(cur))
+                    yield f', "{table_name}": {{"columns": {columns}, "rows": ['
+                else:
+                    yield f', "{table_name}": {"{" if has_id else "["}'
+
+                while True:
+                    chunk = await self._run(
+                        store.encode_chunk,
+                        cur,
+                        table_name,
+                        has_id,
+                        self.stream_chunk_rows,
+                        fmt,
+                    )
+                    if not chunk:
+                        break
+                    yield f"{sep}{chunk}"
+                    sep = ", "
+
+                yield "]}" if fmt == "columnar" else "}" if has_id else "]"
+
+            yield "}"
+        finally:
+            await self._run(stack.close)
 
-                for values in cur.execute(f"SELECT * from {table_name};"):
-                    row = dict(zip([d[0] for d in cur.description], values))
-                    has_id = "id" in row
+    @asynccontextmanager
+    async def open_media(self, path, name):
+        """open a media file in a ``.apkg``, by name, yielding its file and ``ZipInfo``
 
-                    if table_name not in result:
-                        result[table_name] = {} if has_id else []
+        raises ``KeyError`` if there is no such media
+        """
+        stack = ExitStack()
 
-                    for json_field in JSON_FIELDS.get(table_name, []):
-                        row[json_field] = json.loads(row.get(json_field) or "{}")
+        async with self._path_limit(path):
+            fp, info = await self._run(
+                stack.enter_context, self.store.open_media(path, name)
+            )
 
-                    if has_id:
-                        result[table_name][row["id"]] = row
-                    else:
-                        result[table_name] += [row]
+        try:
+            yield fp, info
         finally:
-            db.close()
+            await self._run(stack.close)
 
-        return result
+    async def read_chunks(self, fp, start, end):
+        """yield the bytes of an open file from ``start`` to ``end``, in chunks"""
+        await self._run(fp.seek, start)
+        remaining = end - start
+
+        while remaining > 0:
+            chunk = await self._run(fp.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def changes(self, path, since, projection=None):
+        """get the rows changed since a watermark, and the ids of deleted rows"""
+        async with self._path_limit(path):
+            return await self._submit(self.store.changes, path, since, projection)
+
+    async def search(self, path, query, limit=None):
+        """find the best notes matching an FTS5 ``query`` of their fields and tags
+
+        the search index is built on first use, and rebuilt when the file changes
+        """
+        limit = self._limit(limit, self.search_limit)
+
+        async with self._path_limit(path):
+            return await self._submit(self.store.search, path, query, limit)
+
+    async def query(self, path, query, order="id", limit=None):
+        """get the cards matching a ``query``, and their notes
+
+        see ``janki.query`` for the language, which is compiled to SQL
+        """
+        limit = self._limit(limit, self.page_limit)
+
+        async with self._path_limit(path):
+            return await self._submit(self.store.query, path, query, order, limit)
+
+    async def stats(self, path):
+        """get the review statistics of a collection, cached until the file changes"""
+        return await self._cached(path, "stats", self._stats, path, nbytes=0)
+
+    async def _stats(self, path):
+        async with self._path_limit(path):
+            return await self._submit(self.store.stats, path)
+
+    async def forecast(self, path, days=None, retention=0.9, new_per_day=20, seed=0):
+        """simulate the number of reviews on each of the next ``days``
+
+        see ``janki.forecast.simulate`` for the options
+        """
+        days = min(self.forecast_days if days is None else days, self.forecast_max_days)
+
+        if days < 1 or not 0 <= retention <= 1 or new_per_day < 0:
+            raise ValueError("days must be positive, and retention from 0 to 1")
+
+        async with self._path_limit(path):
+            return await self._submit(
+                functools.partial(
+                    self.store.forecast,
+                    path,
+                    days,
+                    time.time(),
+                    retention=retention,
+                    new_per_day=new_per_day,
+                    seed=seed,
+                )
+            )
+
+    async def catalog(self):
+        """get the summaries of the collections under ``root_dir``, as last scanned
+
+        if not scanned in the last ``catalog_max_age``, a rescan is started in the
+        background
+        """
+        entries = await self._catalog_entries()
+        updated = self._catalog_updated
+
+        if updated is None or time.time() - updated > self.catalog_max_age:
+            self.refresh_catalog()
+
+        return {
+            "collections": [
+                {k: v for k, v in entry.items() if k != "fingerprint"}
+                for path, entry in sorted(entries.items())
+            ],
+            "updated": updated,
+            "scanning": not self._catalog_task.done(),
+        }
+
+    def refresh_catalog(self):
+        """rescan ``root_dir``, summarizing only new and changed collections
+
+        returns a future, shared with any rescan already running
+        """
+        if self._catalog_task is None or self._catalog_task.done():
+            self._catalog_task = asyncio.ensure_future(self._refresh_catalog())
+        return self._catalog_task
+
+    async def _catalog_entries(self):
+        """the catalog entries, by path, read from ``cache_dir`` on first use"""
+        if self._catalog is None:
+            entries = await self._run(self.store.read_catalog)
+            if self._catalog is None:
+                self._catalog = entries
+        return self._catalog
+
+    async def _refresh_catalog(self):
+        entries = await self._catalog_entries()
+        found = await self._submit(self.store.scan)
+        limit = asyncio.Semaphore(self.catalog_max_workers)
+
+        async def summarize(path):
+            async with limit, self._path_limit(path):
+                try:
+                    summary = await self._submit(self.store.summarize, path)
+                except (ValueError, OSError, sqlite3.Error, zipfile.BadZipFile) as err:
+                    summary = {"path": path, "error": str(err)}
+            entries[path] = {**found[path], **summary}
+
+        removed = set(entries) - set(found)
+
+        for path in removed:
+            entries.pop(path)
+
+        stale = [
+            path
+            for path, stat in found.items()
+            if entries.get(path, {}).get("fingerprint") != stat["fingerprint"]
+        ]
+
+        if stale:
+            self.log_(f"cataloging {len(stale)} collections")
+            await asyncio.gather(*map(summarize, stale))
+
+        if stale or removed:
+            await self._run(self.store.write_catalog, dict(entries))
+
+        self._catalog_updated = time.time()
+
+    def start_watching(self):
+        """watch ``root_dir``, rewarming changed collections once they settle"""
+        self.stop_watching()
+        kind = self.watcher_kind
+
+        if kind == "auto":
+            kind = "watchdog" if has_watchdog() else "poll"
+
+        if kind == "watchdog":
+            self._watcher = WatchdogWatcher(self.root_path, self.collection_changed)
+        else:
+            self._watcher = PollingWatcher(
+                self._scan, self.collection_changed, self.watch_interval
+            )
+
+        self.log_(f"watching {self.root_path} with {kind}")
+        self._watcher.start()
+
+    async def _scan(self):
+        return await self._run(self.store.scan)
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+        for timer in self._watch_timers.values():
+            IOLoop.current().remove_timeout(timer)
+
+        self._watch_timers.clear()
+
+    def collection_changed(self, path):
+        """rewarm a changed collection after ``watch_debounce``, restarting the wait
+        on each further change
+        """
+        loop = IOLoop.current()
+        timer = self._watch_timers.pop(path, None)
+
+        if timer is not None:
+            loop.remove_timeout(timer)
+
+        self._watch_timers[path] = loop.call_later(
+            self.watch_debounce, self.rewarm, path
+        )
+
+    async def rewarm(self, path):
+        """drop everything derived from a collection, then rebuild the cached
+        responses and search index which were in use, and update the catalog
+        """
+        self._watch_timers.pop(path, None)
+        resolved = str((self.root_path / path).resolve())
+        variants = [key[2] for key in self.cache if key[0] == resolved]
+        self.cache.discard(lambda key: key[0] == resolved)
+
+        async with self._path_limit(path):
+            had_index = await self._run(self.store.invalidate, path)
+
+        self._catalog_updated = None
+        self.refresh_catalog()
+
+        if stat_key(self.root_path / path) is None:
+            return
+
+        self.log_(f"rewarming {path}")
+
+        try:
+            for variant in variants:
+                if variant == "stats":
+                    await self.stats(path)
+                elif variant[0] != "compressed":
+                    await self.load(path, *variant)
+
+            if had_index:
+                async with self._path_limit(path):
+                    await self._submit(self.store.index, path)
+        except (ValueError, OSError, sqlite3.Error, zipfile.BadZipFile) as err:
+            self.log_(f"failed to rewarm {path}: {err}")
+
+    async def write(self, path, notes=(), cards=()):
+        """insert and update notes and cards in one transaction, then drop, and
+        rewarm, everything derived from the collection
+
+        see ``janki.write.Writer`` for how rows are written
+        """
+        async with self._path_limit(path):
+            response = await self._submit(
+                self.store.write, path, [*notes], [*cards], time.time()
+            )
+
+        await self.rewarm(path)
+        return response
+
+    async def page(self, path, table_name, after=None, limit=None, sort="id"):
+        """get a page of rows from one table, in ``sort`` (then ``id``) order
+
+        returns the rows, and a ``next`` cursor for the following page, if any
+        """
+        limit = self._limit(limit, self.page_limit)
+
+        async with self._path_limit(path):
+            return await self._submit(
+                self.store.page, path, table_name, after, limit, sort
+            )
+
+    def _limit(self, limit, default):
+        """a requested number of rows, or the ``default``, at most ``page_max_limit``"""
+        limit = default if limit is None else limit
+
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, not {limit}")
+
+        return min(limit, self.page_max_limit)
 
     @property
     def contents_manager(self):
         return self.parent.contents_manager
 
-    async def load(self, path):
-        response = await self._load(path)
+    async def load(self, path, projection=None, fmt="objects"):
+        """load a collection response, reusing a cached one if the file is unchanged
+
+        concurrent loads of the same, unchanged collection share a single load.
+        ``projection`` is from ``projection()``, and ``fmt`` one of ``FORMATS``.
+        Cached responses are shared, and must not be modified.
+        """
+        check_format(fmt)
+        projection = projection or self.projection()
+        return await self._cached(
+            path, (projection, fmt), self._load, path, projection, fmt
+        )
+
+    async def _cached(self, path, variant, load, *args, nbytes=None):
+        """get a response derived from the file at ``path`` from the cache, or
+        share a single ``load(*args)`` of it, cached until the file changes
+
+        ``nbytes`` is the size of the response, or a function of it, defaulting to
+        the file's
+        """
+        key = stat_key(self.root_path / path)
+
+        if key is None:
+            return await load(*args)
+
+        key = (*key, variant)
+        response = self.cache.get(key)
+
+        if response is None:
+            loading = self._loading.get(key)
+
+            if loading is None:
+                loading = self._loading[key] = asyncio.ensure_future(
+                    self._cache_put(key, nbytes, load(*args))
+                )
+                loading.add_done_callback(lambda _: self._loading.pop(key, None))
 
-        self.strict and self.validate(response)
+            # one cancelled request shouldn't cancel the others
+            response = await asyncio.shield(loading)
 
         return response
 
-    def validate(self, response):
-        return self.validator.validate(response)
+    async def _cache_put(self, key, nbytes, loading):
+        response = await loading
+        resolved, fingerprint, _ = key
+        self.cache.discard(lambda k: k[0] == resolved and k[1] != fingerprint)
+
+        if nbytes is None:
+            nbytes = fingerprint[1]
+        elif callable(nbytes):
+            nbytes = nbytes(response)
+
+        self.cache.put(key, response, nbytes)
+        return response
+
+    async def compressed(self, path, variant, coding, load):
+        """get the response from awaiting ``load()``, serialized and compressed with
+        ``coding``, cached (by ``variant``) until the file at ``path`` changes
+
+        returns the coding, or ``None`` if smaller than ``compress_min_bytes``, and
+        the body
+        """
+        return await self._cached(
+            path,
+            ("compressed", variant, coding),
+            self._compress,
+            coding,
+            load,
+            nbytes=lambda coded: len(coded[1]),
+        )
+
+    async def _compress(self, coding, load):
+        body = await self._run(self.serializer.dumpb, await load())
+
+        if len(body) < self.compress_min_bytes:
+            return None, body
+
+        return coding, await self._run(compression.compress, coding, body)
+
+    async def encode(self, path, projection=None, fmt="objects", encoding="json"):
+        """get a collection response as bytes in a binary encoding
+
+        ``msgpack`` encodes the (cached) response. ``arrow`` reads one table
+        straight from its cursor, and is always columnar.
+        """
+        if not available(encoding) or encoding == "json":
+            raise ValueError(f"{encoding} is not an available binary encoding")
+
+        projection = projection or self.projection()
+
+        if encoding == "arrow":
+            async with self._path_limit(path):
+                return await self._submit(self.store.arrow, path, projection)
+
+        response = await self.load(path, projection, fmt)
+        return await self._run(encode_msgpack, response)
+
+    async def _load(self, path, projection, fmt):
+        async with self._path_limit(path):
+            response = await self._submit(self.store.load, path, projection, fmt)
+
+        if self.strict:
+            self.validate(response, projection != self.projection(), fmt)
+
+        return response
+
+    def validate(self, response, partial=False, fmt="objects"):
+        """raise a ``jsonschema.ValidationError`` if a response is invalid
+
+        partial (projected) responses can't satisfy the whole-collection schema,
+        so are only checked by the ``compiled`` engine, without ``required``
+        """
+        validator = self.columnar_validator if fmt == "columnar" else self.validator
+        if isinstance(validator, CompiledValidator):
+            return validator.validate(response, partial=partial)
+        if not partial:
+            return validator.validate(response)
 
     def initialize(self):
         self.log_("initializing...")
@@ -130,7 +888,22 @@ class JankiManager(LoggingConfigurable):
                 janki_manager=Instance(JankiManager, default_value=self)
             )
 
+        for validator in [self.validator, self.columnar_validator]:
+            if self.strict and isinstance(validator, CompiledValidator):
+                validator.compile()
+
+        if self.catalog_prewarm:
+            IOLoop.current().add_callback(self.refresh_catalog)
+
+        if self.watch:
+            self.start_watching()
+
         self.log_("initialized!")
 
+    def shutdown(self):
+        """stop accepting work, and stop the workers when they finish"""
+        for executor in {self.executor, self.thread_executor}:
+            executor.shutdown(wait=False)
+
     def log_(self, *args, **kwargs):
         self.log.warning(f"🃏 {args[0]}", *args[1:], **kwargs)
@@ -0,0 +1,101 @@
+"""a restricted, anki-like filter language for cards, compiled to parameterized SQL
+
+terms are separated by whitespace, and must all match. A term starting with ``-``
+must not match.
+
+- ``deck:1``: the card is in the deck with id ``1``
+- ``queue:2`` or ``queue:review``: the card is in a scheduling queue
+- ``due<10``, ``due>=3``, ``due=5``, ``due:3..10``: the card's ``due`` is in range
+- ``flag:1``: the card has a flag, ``0`` for none
+- ``tag:noun``, ``tag:adj*``: the card's note has a tag, maybe with wildcards
+- ``mid:1555579331146``: the card's note has a note type
+"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import re
+
+#: named card queues
+QUEUES = {
+    "buried": -2,
+    "suspended": -1,
+    "new": 0,
+    "learn": 1,
+    "review": 2,
+    "daylearn": 3,
+    "preview": 4,
+}
+
+RE_TERM = re.compile(
+    r"""^(?P<negate>-?)(?:
+        (?P<key>deck|queue|flag|tag|mid):(?P<value>.+)
+        |due(?P<op><=|>=|<|>|=)(?P<bound>-?\d+)
+        |due:(?P<low>-?\d+)\.\.(?P<high>-?\d+)
+    )$""",
+    re.VERBOSE,
+)
+
+
+def _int(key, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{key}:{value} is not a number")
+
+
+def _like(value):
+    """a ``LIKE`` pattern for one space-delimited tag, with ``*`` wildcards"""
+    escaped = re.sub(r"([\\%_])", r"\\\1", value).replace("*", "%")
+    return f"% {escaped} %"
+
+
+def compile_term(term):
+    """compile one term into a SQL condition, its parameters, and whether it needs
+    the card's note
+    """
+    match = RE_TERM.match(term)
+
+    if match is None:
+        raise ValueError(f"{term} is not a valid query term")
+
+    key, value = match["key"], match["value"]
+
+    if key == "deck":
+        sql, params = "c.did = ?", [_int(key, value)]
+    elif key == "queue":
+        queue = QUEUES.get(value.lower())
+        sql, params = "c.queue = ?", [_int(key, value) if queue is None else queue]
+    elif key == "flag":
+        sql, params = "(c.flags & 7) = ?", [_int(key, value)]
+    elif key == "tag":
+        sql, params = "(' ' || n.tags || ' ') LIKE ? ESCAPE '\\'", [_like(value)]
+    elif key == "mid":
+        sql, params = "n.mid = ?", [_int(key, value)]
+    elif match["op"]:
+        sql, params = f"c.due {match['op']} ?", [int(match["bound"])]
+    else:
+        sql, params = "c.due BETWEEN ? AND ?", [int(match["low"]), int(match["high"])]
+
+    if match["negate"]:
+        sql = f"NOT ({sql})"
+
+    return sql, params, key in ["tag", "mid"]
+
+
+def compile_query(query):
+    """compile a query into a ``WHERE`` clause, its parameters, and whether it
+    needs ``notes`` joined as ``n``
+    """
+    conditions = []
+    params = []
+    needs_notes = False
+
+    for term in (query or "").split():
+        sql, term_params, term_needs_notes = compile_term(term)
+        conditions += [sql]
+        params += term_params
+        needs_notes = needs_notes or term_needs_notes
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    return where, params, needs_notes
@@ -33,3 +33,295 @@ def make_validator(
 
 def load_schema():
     return json.loads(SCHEMA.read_text(encoding="utf-8"))
+
+
+#: keywords which don't constrain instances
+ANNOTATIONS = {"$schema", "default", "description", "examples", "format", "title"}
+
+#: keywords understood by ``SchemaCompiler``, others use ``jsonschema``
+KEYWORDS = {"$ref", "additionalProperties", "anyOf", "items", "properties", "required"}
+KEYWORDS |= {"type", "enum", "const"}
+
+TYPES = {
+    "array": lambda v: isinstance(v, list),
+    "boolean": lambda v: isinstance(v, bool),
+    "integer": lambda v: (
+        isinstance(v, int)
+        and not isinstance(v, bool)
+        or isinstance(v, float)
+        and v.is_integer()
+    ),
+    "null": lambda v: v is None,
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "object": lambda v: isinstance(v, dict),
+    "string": lambda v: isinstance(v, str),
+}
+
+
+def _fail(message, path):
+    raise jsonschema.ValidationError(message, path=[*path])
+
+
+def _ok(instance, path):
+    pass
+
+
+class SchemaCompiler:
+    """compile JSON schema into nested python functions, which raise a
+    ``jsonschema.ValidationError`` for the first error found
+
+    if ``partial``, ``required`` is not checked, e.g. for projected responses
+    """
+
+    def __init__(self, root, partial=False):
+        self.root = root
+        self.partial = partial
+        self._refs = {}
+
+    def resolve(self, ref):
+        schema = self.root
+        for bit in ref.lstrip("#/").split("/"):
+            schema = schema[bit]
+        return schema
+
+    def compile(self, schema):
+        if schema is True:
+            return _ok
+        if schema is False:
+            return lambda instance, path: _fail("False schema does not allow it", path)
+
+        if REF in schema:
+            return self._ref(schema[REF])
+
+        if set(schema) - KEYWORDS - ANNOTATIONS:
+            return self._fallback(schema)
+
+        # e.g. maps of ids to objects, checked as objects with no named properties
+        if "additionalProperties" in schema and "properties" not in schema:
+            schema = {**schema, "properties": {}}
+
+        checks = [
+            compile_keyword(schema)
+            for keyword, compile_keyword in [
+                ("type", self._type),
+                ("enum", self._enum),
+                ("const", self._const),
+                ("anyOf", self._any_of),
+                ("items", self._items),
+                ("required", self._required),
+                ("properties", self._properties),
+            ]
+            if keyword in schema
+        ]
+
+        checks = [check for check in checks if check is not _ok]
+
+        if len(checks) == 1:
+            return checks[0]
+
+        def check_all(instance, path):
+            for check in checks:
+                check(instance, path)
+
+        return check_all
+
+    def _ref(self, ref):
+        if ref not in self._refs:
+            # placeholder for recursive references
+            self._refs[ref] = None
+            self._refs[ref] = self.compile(self.resolve(ref))
+
+        refs = self._refs
+
+        def check_ref(instance, path):
+            refs[ref](instance, path)
+
+        return check_ref
+
+    def _fallback(self, schema):
+        validator = jsonschema.Draft7Validator(
+            {**schema, "definitions": self.root.get("definitions", {})}
+        )
+
+        def check_fallback(instance, path):
+            error = jsonschema.exceptions.best_match(validator.iter_errors(instance))
+            if error is not None:
+                _fail(error.message, [*path, *error.path])
+
+        return check_fallback
+
+    def _type(self, schema):
+        types = schema["type"]
+        types = [types] if isinstance(types, str) else types
+        checks = [TYPES[t] for t in types]
+
+        if len(checks) == 1:
+            is_type = checks[0]
+        else:
+
+            def is_type(instance):
+                return any(check(instance) for check in checks)
+
+        def check_type(instance, path):
+            if not is_type(instance):
+                _fail(
+                    f"{instance!r} is not of type {', '.join(map(repr, types))}", path
+                )
+
+        return check_type
+
+    def _enum(self, schema):
+        enum = schema["enum"]
+
+        def check_enum(instance, path):
+            if instance not in enum:
+                _fail(f"{instance!r} is not one of {enum!r}", path)
+
+        return check_enum
+
+    def _const(self, schema):
+        const = schema["const"]
+
+        def check_const(instance, path):
+            if instance != const:
+                _fail(f"{const!r} was expected", path)
+
+        return check_const
+
+    def _any_of(self, schema):
+        checks = [self.compile(sub) for sub in schema["anyOf"]]
+
+        def check_any_of(instance, path):
+            for check in checks:
+                try:
+                    return check(instance, path)
+                except jsonschema.ValidationError:
+                    continue
+            _fail(f"{instance!r} is not valid under any of the given schemas", path)
+
+        return check_any_of
+
+    def _items(self, schema):
+        items = schema["items"]
+
+        if not isinstance(items, dict):
+            return self._fallback({"items": items})
+
+        check = self.compile(items)
+
+        if check is _ok:
+            return _ok
+
+        def check_items(instance, path):
+            if isinstance(instance, list):
+                for i, item in enumerate(instance):
+                    check(item, (*path, i))
+
+        return check_items
+
+    def _required(self, schema):
+        if self.partial:
+            return _ok
+
+        required = schema["required"]
+
+        def check_required(instance, path):
+            if isinstance(instance, dict):
+                for key in required:
+                    if key not in instance:
+                        _fail(f"{key!r} is a required property", path)
+
+        return check_required
+
+    def _properties(self, schema):
+        properties = {
+            key: check
+            for key, check in [
+                (key, self.compile(sub)) for key, sub in schema["properties"].items()
+            ]
+            if check is not _ok
+        }
+        additional = schema.get("additionalProperties", True)
+        check_additional = None if additional is False else self.compile(additional)
+
+        def check_properties(instance, path):
+            if not isinstance(instance, dict):
+                return
+            for key, value in instance.items():
+                check = properties.get(key, check_additional)
+                if check is None:
+                    if key not in schema["properties"]:
+                        _fail(
+                            f"Additional properties are not allowed ({key!r} was "
+                            "unexpected)",
+                            path,
+                        )
+                    continue
+                check(value, (*path, key))
+
+        return check_properties
+
+
+class CompiledValidator:
+    """validate API collection responses table-by-table, and row-by-row, with python
+    compiled from the source-of-truth once
+
+    ``sample`` checks only about that many rows of each table, and ``structural``
+    checks only the response and its tables, not their rows
+    """
+
+    def __init__(
+        self, ref: Text = "#/definitions/api-collection", sample=0, structural=False
+    ):
+        self.ref = ref
+        self.sample = sample
+        self.structural = structural
+        self.schema = load_schema()
+        self._checks = {}
+
+    def validate(self, instance, partial=False):
+        check_response, tables = self.compile(partial)
+
+        check_response(instance, ())
+
+        for table_name, (check_table, check_row) in tables.items():
+            if table_name not in instance:
+                continue
+
+            table = instance[table_name]
+            path = (table_name,)
+
+            check_table(table, path)
+
+            if self.structural:
+                continue
+
+            rows = table.items() if isinstance(table, dict) else enumerate(table)
+            step = max(1, len(table) // self.sample) if self.sample else 1
+
+            for i, (key, row) in enumerate(rows):
+                if not i % step:
+                    check_row(row, (*path, key))
+
+    def compile(self, partial=False):
+        """compile the response and table checks, once"""
+        if partial not in self._checks:
+            compiler = SchemaCompiler(self.schema, partial=partial)
+            schema = dict(compiler.resolve(self.ref))
+            properties = dict(schema.get("properties", {}))
+            tables = {}
+
+            # tables are the properties with rows in `additionalProperties`
+            for name, table in [*properties.items()]:
+                if isinstance(table.get("additionalProperties"), dict):
+                    properties.pop(name)
+                    shape = {k: v for k, v in table.items() if k in ["type"]}
+                    tables[name] = (
+                        compiler.compile(shape),
+                        compiler.compile(table["additionalProperties"]),
+                    )
+
+            schema["properties"] = properties
+            self._checks[partial] = compiler.compile(schema), tables
+
+        return self._checks[partial]
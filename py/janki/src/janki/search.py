@@ -0,0 +1,128 @@
+"""full-text search of notes, with SQLite FTS5 indexes in sidecar databases"""
+
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import html
+import re
+import sqlite3
+from contextlib import closing
+
+from .cache import atomic_write, index_key
+
+FIELD_SEPARATOR = "\x1f"
+
+#: marks around matches in snippets, replaced by ``<mark>`` once they are escaped
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+RE_TAG = re.compile(r"<[^>]*>")
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE VIRTUAL TABLE notes_fts USING fts5(
+    flds, tags, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE note_cards (nid INTEGER, id INTEGER);
+CREATE INDEX ix_note_cards_nid ON note_cards (nid);
+"""
+
+
+def plain_fields(flds):
+    """the text of the fields of a note, one per line, without HTML"""
+    return "\n".join(
+        html.unescape(RE_TAG.sub(" ", field)).strip()
+        for field in flds.split(FIELD_SEPARATOR)
+    )
+
+
+def is_fresh(index_path, fingerprint):
+    """whether an index exists, and was built from the same collection file"""
+    if not index_path.exists():
+        return False
+    try:
+        with closing(sqlite3.connect(str(index_path))) as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'key';").fetchone()
+    except sqlite3.DatabaseError:
+        return False
+    return row is not None and row[0] == index_key(fingerprint)
+
+
+def build(db, index_path, fingerprint):
+    """index the notes (and their cards) of an open collection
+
+    the index is written to a temporary file, then atomically moved into place
+    """
+    with atomic_write(index_path) as tmp_path:
+        with closing(sqlite3.connect(str(tmp_path))) as index:
+            index.executescript(SCHEMA)
+            index.execute(
+                "INSERT INTO meta VALUES ('key', ?);", [index_key(fingerprint)]
+            )
+            index.executemany(
+                "INSERT INTO notes_fts (rowid, flds, tags) VALUES (?, ?, ?);",
+                (
+                    (nid, plain_fields(flds or ""), (tags or "").strip())
+                    for nid, flds, tags in db.execute(
+                        "SELECT id, flds, tags FROM notes;"
+                    )
+                ),
+            )
+            index.executemany(
+                "INSERT INTO note_cards VALUES (?, ?);",
+                db.execute("SELECT nid, id FROM cards ORDER BY nid, ord;"),
+            )
+            index.execute("INSERT INTO notes_fts (notes_fts) VALUES ('optimize');")
+            index.commit()
+
+
+def escape_snippet(snippet):
+    """the HTML of a snippet of plain text, with its matches in ``<mark>``"""
+    return (
+        html.escape(snippet, quote=False)
+        .replace(MARK_START, "<mark>")
+        .replace(MARK_END, "</mark>")
+    )
+
+
+def search(index_path, query, limit):
+    """find notes matching an FTS5 ``query``, best first, with snippets
+
+    raises ``ValueError`` for malformed queries
+    """
+    with closing(sqlite3.connect(str(index_path))) as index:
+        try:
+            rows = index.execute(
+                """
+                SELECT
+                    rowid,
+                    bm25(notes_fts),
+                    snippet(notes_fts, 0, ?, ?, '…', 16),
+                    tags
+                FROM notes_fts
+                WHERE notes_fts MATCH ?
+                ORDER BY bm25(notes_fts)
+                LIMIT ?;
+                """,
+                [MARK_START, MARK_END, query, limit],
+            ).fetchall()
+        except sqlite3.OperationalError as err:
+            raise ValueError(f"{query} is not a valid search: {err}")
+
+        results = []
+
+        for nid, rank, snippet, tags in rows:
+            cards = index.execute(
+                "SELECT id FROM note_cards WHERE nid = ?;", [nid]
+            ).fetchall()
+            results += [
+                {
+                    "id": nid,
+                    "rank": rank,
+                    "snippet": escape_snippet(snippet),
+                    "tags": tags.split(),
+                    "cards": [cid for (cid,) in cards],
+                }
+            ]
+
+    return results
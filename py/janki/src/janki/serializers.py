@@ -0,0 +1,49 @@
+"""encoding responses as, and decoding fields from, JSON"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import importlib.util
+import json
+
+
+class JSONSerializer:
+    """encode and decode JSON with the standard library
+
+    subclasses must remain picklable, as stores are sent to worker processes
+    """
+
+    def dumps(self, value):
+        """encode a value as JSON text"""
+        return json.dumps(value)
+
+    def dumpb(self, value):
+        """encode a value as UTF-8 JSON bytes"""
+        return self.dumps(value).encode("utf-8")
+
+    def loads(self, text):
+        """decode JSON text or bytes"""
+        return json.loads(text)
+
+
+class OrjsonSerializer(JSONSerializer):
+    """encode and decode JSON with ``orjson``, allowing integer keys, like ``json``"""
+
+    def dumps(self, value):
+        return self.dumpb(value).decode("utf-8")
+
+    def dumpb(self, value):
+        import orjson
+
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, text):
+        import orjson
+
+        return orjson.loads(text)
+
+
+def default_serializer_class():
+    """the fastest serializer which can be imported"""
+    if importlib.util.find_spec("orjson") is not None:
+        return OrjsonSerializer
+    return JSONSerializer
@@ -0,0 +1,108 @@
+"""review statistics of a collection, aggregated in SQL"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+#: the lower bounds, in days, of the buckets of review intervals for retention
+RETENTION_BUCKETS = [0, 1, 7, 21, 90, 365]
+
+#: the size, in permille, of the buckets of card ease factors
+EASE_BUCKET = 100
+
+#: ``revlog.type`` for reviews of cards in the review queue
+REVIEW = 1
+
+#: ``cards.type`` for cards in the review queue
+REVIEW_CARD = 2
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def _rows(db, sql, params=(), names=None):
+    cur = db.execute(sql, params)
+    names = names or [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur]
+
+
+def _bucket(column, bounds):
+    """a SQL expression for the index of the bucket containing a column value
+
+    negative ``revlog`` intervals are seconds, so fall in the first bucket
+    """
+    cases = " ".join(
+        f"WHEN {column} < {upper} THEN {i}" for i, upper in enumerate(bounds[1:])
+    )
+    return f"CASE {cases} ELSE {len(bounds) - 1} END"
+
+
+def reviews_per_day(db):
+    """the reviews, correct answers and time spent (in ms) on each UTC day, as days
+    since the epoch
+    """
+    return _rows(
+        db,
+        "SELECT id / ? AS day, COUNT(*) AS reviews, SUM(ease > 1) AS correct, "
+        "SUM(time) AS time FROM revlog GROUP BY day ORDER BY day;",
+        [MS_PER_DAY],
+    )
+
+
+def retention(db):
+    """the share of reviews answered correctly, by the previous interval in days"""
+    rows = _rows(
+        db,
+        f"SELECT {_bucket('lastIvl', RETENTION_BUCKETS)} AS bucket, "
+        "COUNT(*) AS reviews, SUM(ease > 1) AS correct "
+        "FROM revlog WHERE type = ? GROUP BY bucket ORDER BY bucket;",
+        [REVIEW],
+    )
+    bounds = [*RETENTION_BUCKETS, None]
+
+    return [
+        {
+            "min": bounds[row["bucket"]],
+            "max": bounds[row["bucket"] + 1],
+            "reviews": row["reviews"],
+            "correct": row["correct"],
+            "retention": row["correct"] / row["reviews"],
+        }
+        for row in rows
+    ]
+
+
+def ease(db):
+    """the number of review cards in each bucket of ease factor, in permille"""
+    return _rows(
+        db,
+        "SELECT factor / ? * ? AS factor, COUNT(*) AS cards FROM cards "
+        "WHERE type = ? GROUP BY 1 ORDER BY 1;",
+        [EASE_BUCKET, EASE_BUCKET, REVIEW_CARD],
+    )
+
+
+def time_spent(db):
+    """the number of, and time spent (in ms) on, each type of review"""
+    return _rows(
+        db,
+        "SELECT type, COUNT(*) AS reviews, SUM(time) AS time "
+        "FROM revlog GROUP BY type ORDER BY type;",
+    )
+
+
+def buttons(db):
+    """how often each answer button was pressed, by type of review"""
+    return _rows(
+        db,
+        "SELECT type, ease, COUNT(*) AS reviews FROM revlog "
+        "GROUP BY type, ease ORDER BY type, ease;",
+    )
+
+
+def collection_stats(db):
+    """all the statistics of an open collection"""
+    return {
+        "days": reviews_per_day(db),
+        "retention": retention(db),
+        "ease": ease(db),
+        "time": time_spent(db),
+        "buttons": buttons(db),
+    }
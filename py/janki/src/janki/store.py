@@ -0,0 +1,790 @@
+"""synchronous access to the SQLite databases of anki collections"""
+
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import base64
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+from . import archive
+from ._version import __version__
+from .cache import (
+    DiskCache,
+    PayloadCache,
+    content_hash,
+    digest,
+    file_lock,
+    private_dir,
+    stat_key,
+)
+from .constants import (
+    ARROW_BATCH_ROWS,
+    CHANGE_COLUMNS,
+    CHUNK_SIZE,
+    FORMATS,
+    GRAVE_TYPES,
+    JSON_FIELDS,
+    TABLE_NAMES,
+)
+from .serializers import JSONSerializer
+
+#: bump to ignore all existing payloads
+PAYLOAD_VERSION = 1
+
+#: the read and write versions in a SQLite header, ``2`` for WAL
+HEADER_VERSIONS = slice(18, 20)
+ROLLBACK_JOURNAL = b"\x01\x01"
+
+
+def encode_cursor(keys):
+    """encode the sort keys of the last row of a page as an opaque cursor
+
+    a page sorted only by ``id`` has the plain ``id`` as its cursor
+    """
+    if len(keys) == 1 and isinstance(keys[0], int):
+        return str(keys[0])
+    return base64.urlsafe_b64encode(json.dumps(keys).encode("utf-8")).decode("utf-8")
+
+
+def decode_cursor(cursor, count):
+    """decode a cursor from ``encode_cursor`` into ``count`` sort keys"""
+    try:
+        if count == 1:
+            return [int(cursor)]
+        keys = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+    except ValueError:
+        raise ValueError(f"{cursor} is not a valid cursor")
+
+    if not isinstance(keys, list) or len(keys) != count:
+        raise ValueError(f"{cursor} is not a valid cursor")
+
+    return keys
+
+
+def make_projection(tables=None, fields=None):
+    """normalize the requested tables and ``table.column`` fields
+
+    tables default to those named in ``fields``, or all tables. Returns
+    ``(table, columns)`` pairs, where ``columns`` of ``None`` selects all.
+    """
+    columns = {}
+
+    for field in fields or []:
+        table_name, dot, column = field.partition(".")
+        if not (dot and column):
+            raise ValueError(f"{field} is not a table.column field")
+        columns.setdefault(table_name, []).append(column)
+
+    tables = set(tables or columns or TABLE_NAMES)
+    unknown = sorted((tables | set(columns)) - set(TABLE_NAMES))
+
+    if unknown:
+        raise ValueError(f"{', '.join(unknown)} are not tables")
+
+    if set(columns) - tables:
+        raise ValueError(f"fields {sorted(columns)} are not all in {sorted(tables)}")
+
+    return tuple(
+        (t, None if t not in columns else tuple(sorted(set(columns[t]))))
+        for t in TABLE_NAMES
+        if t in tables
+    )
+
+
+def check_format(fmt):
+    """raise a ``ValueError`` if ``fmt`` is not a response format"""
+    if fmt not in FORMATS:
+        raise ValueError(f"{fmt} is not one of {', '.join(FORMATS)}")
+
+
+class RollbackJournal:
+    """read a SQLite file, with its header marked as rollback-journal, not WAL, so
+    read-only connections to a copy need no ``-wal`` or ``-shm`` files
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.header = bytearray(source.read(100))
+        if len(self.header) == 100:
+            self.header[HEADER_VERSIONS] = ROLLBACK_JOURNAL
+
+    def read(self, size=-1):
+        if self.header:
+            header, self.header = bytes(self.header), None
+            return header
+        return self.source.read(size)
+
+
+class CollectionStore:
+    """open, and read from, collections in ``.anki2`` files or ``.apkg`` archives
+
+    only holds plain settings, so its methods may be run in worker threads or
+    processes
+    """
+
+    def __init__(
+        self,
+        root_dir,
+        cache_dir,
+        extract_cache_max_bytes,
+        apkg_strategy="disk",
+        memory_max_bytes=0,
+        serializer=None,
+        payload_cache_dir=None,
+        payload_cache_max_bytes=0,
+        payload_compression="none",
+        payload_cache_shared=False,
+        log=None,
+    ):
+        self.root_path = Path(root_dir)
+        self.extract_cache_max_bytes = extract_cache_max_bytes
+        self.apkg_strategy = apkg_strategy
+        self.memory_max_bytes = memory_max_bytes
+        self.serializer = serializer or JSONSerializer()
+        # everything read back from here is trusted, so refuse a directory others
+        # could have planted files in
+        private_dir(cache_dir)
+        self.extracted = DiskCache(
+            Path(cache_dir) / "extracted", extract_cache_max_bytes
+        )
+        self.payloads = None
+        if payload_cache_dir and payload_cache_max_bytes:
+            self.payloads = PayloadCache(
+                payload_cache_dir,
+                payload_cache_max_bytes,
+                None if payload_compression == "none" else payload_compression,
+                shared=payload_cache_shared,
+            )
+        self.search_path = Path(cache_dir) / "search"
+        self.archives_path = Path(cache_dir) / "archives"
+        self.locks_path = Path(cache_dir) / "locks"
+        self.catalog_path = (
+            Path(cache_dir)
+            / "catalog"
+            / f"{digest(str(self.root_path.resolve()))}.json"
+        )
+        self.log = log or logging.getLogger(__name__)
+
+    def load(self, contents_path, projection=None, fmt="objects"):
+        """load the API response for an ``.anki2`` file (maybe inside a ``.apkg``)
+
+        responses are kept in the payload cache, if any, by the hash of the file's
+        contents, so they are shared by all processes using the cache, and by
+        copies of the same file
+        """
+        name = self.payloads and self._payload_name(contents_path, projection, fmt)
+
+        if not name:
+            with self.open(contents_path) as db:
+                return self.get_api_response(db, contents_path, projection, fmt)
+
+        data = self.payloads.get_bytes(name)
+
+        if data is None:
+            with self.payloads.lock(name):
+                data = self.payloads.get_bytes(name)
+
+                if data is None:
+                    with self.open(contents_path) as db:
+                        response = self.get_api_response(
+                            db, contents_path, projection, fmt
+                        )
+                    data = self.serializer.dumpb({**response, "path": None})
+                    self.payloads.put_bytes(name, data)
+                    return response
+
+        return self._from_payload(data, contents_path, fmt)
+
+    def _payload_name(self, contents_path, projection, fmt):
+        """the name of the payload of a response, from the hash of the contents of
+        its file, which is itself cached by the file's freshness
+        """
+        key = stat_key(self.root_path / contents_path)
+
+        if key is None:
+            return None
+
+        hash_name = f"{digest(key)}.sha256"
+        hash_path = self.payloads.get(hash_name)
+
+        try:
+            sha = hash_path and hash_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            sha = None
+
+        if not sha:
+            sha = content_hash(key[0])
+            self.payloads.put(hash_name, io.BytesIO(sha.encode("utf-8")))
+
+        projection = projection or make_projection()
+        return digest((PAYLOAD_VERSION, __version__, sha, projection, fmt))
+
+    def _from_payload(self, data, contents_path, fmt):
+        """decode a cached payload, restoring its path and integer ids"""
+        response = self.serializer.loads(data)
+        response["path"] = contents_path
+
+        if fmt == "objects":
+            for table_name, rows in response.items():
+                if isinstance(rows, dict):
+                    response[table_name] = {int(k): v for k, v in rows.items()}
+
+        return response
+
+    @contextmanager
+    def open(self, contents_path):
+        """open an ``.anki2`` file (maybe from inside a ``.apkg`` archive)
+        TODO: actually use contents_manager API
+        """
+        full_contents_path = self.root_path / contents_path
+
+        if not full_contents_path.exists():
+            raise ValueError(f"{contents_path} not found")
+
+        suffix = full_contents_path.suffix
+
+        if suffix == ".anki2":
+            with closing(self._connect(full_contents_path, read_only=True)) as db:
+                yield db
+            return
+        elif suffix == ".apkg":
+            for info in self._collection_members(full_contents_path):
+                if self._in_memory(info):
+                    with closing(self._deserialize(full_contents_path, info)) as db:
+                        yield db
+                    return
+
+                with self._open_extracted(full_contents_path, info) as db:
+                    yield db
+                return
+
+        raise ValueError(f"{contents_path} was not recognized")
+
+    @contextmanager
+    def open_media(self, contents_path, name):
+        """open a media file in a ``.apkg`` archive by its name in the ``media`` map,
+        yielding a readable (and seekable) file, and its ``ZipInfo``
+
+        raises ``KeyError`` if there is no such media
+        """
+        full_contents_path = self.root_path / contents_path
+
+        if full_contents_path.suffix != ".apkg" or not full_contents_path.exists():
+            raise ValueError(f"{contents_path} is not a package")
+
+        index = self._index(full_contents_path)
+        member = index["media"][name]
+        info = archive.member_info(member, index["members"][member])
+
+        with archive.open_member(full_contents_path, info) as fp:
+            yield fp, info
+
+    def _index(self, apkg_path):
+        """the index of the members, and media, of a ``.apkg``, rebuilt if stale"""
+        key = stat_key(apkg_path)
+
+        if key is None:
+            raise ValueError(f"{apkg_path.name} not found")
+
+        index_path = self._archive_index_path(key[0])
+        return archive.read_index(apkg_path, index_path, key[1])
+
+    def _archive_index_path(self, resolved):
+        return self.archives_path / f"{digest(resolved)}.json"
+
+    def _collection_members(self, apkg_path):
+        """the ``ZipInfo`` of each top-level ``.anki2`` member of a ``.apkg``"""
+        return [
+            archive.member_info(name, entry)
+            for name, entry in self._index(apkg_path)["members"].items()
+            if name.endswith(".anki2") and "/" not in name
+        ]
+
+    def _in_memory(self, info):
+        """whether to deserialize an ``.anki2`` member straight into memory"""
+        return (
+            self.apkg_strategy == "memory"
+            and hasattr(sqlite3.Connection, "deserialize")
+            and info.file_size <= self.memory_max_bytes
+        )
+
+    def _deserialize(self, apkg_path, info):
+        with archive.open_member(apkg_path, info) as fp:
+            data = bytearray(fp.read())
+        # in-memory databases can't be WAL
+        data[HEADER_VERSIONS] = ROLLBACK_JOURNAL
+        db = self._connect(":memory:")
+        db.deserialize(data)
+        return db
+
+    @contextmanager
+    def _open_extracted(self, apkg_path, info):
+        """open an ``.anki2`` member of a ``.apkg``, copied to disk, read-only
+
+        copies are kept in ``cache_dir`` until the archive changes, or they are
+        evicted by more recently-used copies
+        """
+        key = stat_key(apkg_path)
+
+        if key is None or info.file_size > self.extract_cache_max_bytes:
+            with tempfile.TemporaryDirectory() as td:
+                db_path = Path(td) / "collection.anki2"
+                with archive.open_member(apkg_path, info) as source:
+                    with db_path.open("wb") as dest:
+                        shutil.copyfileobj(RollbackJournal(source), dest, CHUNK_SIZE)
+                with closing(self._connect(db_path, read_only=True)) as db:
+                    yield db
+            return
+
+        prefix = digest(key[0])
+        name = f"{prefix}-{digest((key[1], info.filename))}.anki2"
+        db_path = self.extracted.get(name)
+        db = None
+
+        if db_path is not None:
+            try:
+                db = self._connect(db_path, read_only=True)
+            except sqlite3.OperationalError:
+                # evicted by another process since it was found: extract it again
+                db = None
+
+        if db is None:
+            self.extracted.discard(prefix)
+            with archive.open_member(apkg_path, info) as source:
+                db_path = self.extracted.put(name, RollbackJournal(source))
+            db = self._connect(db_path, read_only=True)
+
+        with closing(db):
+            yield db
+
+    def _connect(self, db_path, read_only=False):
+        # streamed cursors are advanced from whichever executor thread is free
+        if read_only:
+            # never create an empty database where a file has just gone missing
+            uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+            return sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return sqlite3.connect(str(db_path), check_same_thread=False)
+
+    def get_api_response(self, db, contents_path, projection=None, fmt="objects"):
+        """read all the (projected) tables of a collection into a response
+
+        in the ``columnar`` format, each table is its ``columns``, and ``rows`` of
+        values in that order
+        """
+        check_format(fmt)
+        result = {"path": contents_path}
+
+        for table_name, columns in projection or make_projection():
+            self.log_(table_name)
+            cur = self.select(db, table_name, columns)
+
+            if fmt == "columnar":
+                result[table_name] = {
+                    "columns": self.column_names(cur),
+                    "rows": [*self.iter_values(cur, table_name)],
+                }
+                continue
+
+            has_id = self.has_id(cur)
+            rows = self.iter_rows(cur, table_name)
+
+            if has_id:
+                result[table_name] = {row["id"]: row for row in rows}
+            else:
+                result[table_name] = [*rows]
+
+        return result
+
+    def select(self, db, table_name, columns=None, where="", params=()):
+        """execute a ``SELECT`` of some columns of a table, always including ``id``"""
+        columns = self._check_columns(db, table_name, columns)
+        return db.execute(
+            f"SELECT {', '.join(columns or '*')} from {table_name} {where};", params
+        )
+
+    def _check_columns(self, db, table_name, columns=None):
+        if columns is None:
+            return None
+
+        known = self._columns(db, table_name)
+        unknown = sorted(set(columns) - set(known))
+
+        if unknown:
+            raise ValueError(f"{table_name} has no columns {', '.join(unknown)}")
+
+        return [c for c in known if c in columns or c == "id"]
+
+    def check_projection(self, db, projection):
+        for table_name, columns in projection:
+            self._check_columns(db, table_name, columns)
+
+    def has_id(self, cur):
+        return "id" in self.column_names(cur)
+
+    def column_names(self, cur):
+        return [d[0] for d in cur.description]
+
+    def iter_values(self, cur, table_name, size=None):
+        """yield rows from a cursor as lists, with any JSON fields decoded
+
+        if ``size`` is given, only fetch that many rows
+        """
+        columns = self.column_names(cur)
+        json_fields = [
+            i for i, c in enumerate(columns) if c in JSON_FIELDS.get(table_name, [])
+        ]
+        rows = cur if size is None else cur.fetchmany(size)
+        loads = self.serializer.loads
+
+        if not json_fields:
+            yield from map(list, rows)
+            return
+
+        for values in rows:
+            values = list(values)
+
+            for i in json_fields:
+                values[i] = loads(values[i] or "{}")
+
+            yield values
+
+    def iter_rows(self, cur, table_name, size=None):
+        """yield rows from a cursor as dicts, with any JSON fields decoded"""
+        columns = self.column_names(cur)
+
+        for values in self.iter_values(cur, table_name, size):
+            yield dict(zip(columns, values))
+
+    def encode_chunk(self, cur, table_name, has_id, size, fmt="objects"):
+        """encode the next ``size`` rows of a cursor as JSON text, or ``""``"""
+        dumps = self.serializer.dumps
+
+        if fmt == "columnar":
+            return ", ".join(
+                dumps(values) for values in self.iter_values(cur, table_name, size)
+            )
+
+        rows = self.iter_rows(cur, table_name, size)
+
+        if has_id:
+            return ", ".join(f'"{row["id"]}": {dumps(row)}' for row in rows)
+
+        return ", ".join(dumps(row) for row in rows)
+
+    def arrow(self, contents_path, projection):
+        """read the (projected) columns of one table as an Arrow IPC stream"""
+        from .encoders import encode_arrow
+
+        if len(projection) != 1:
+            raise ValueError("arrow responses hold exactly one table")
+
+        ((table_name, columns),) = projection
+
+        with self.open(contents_path) as db:
+            columns = self._check_columns(db, table_name, columns)
+            columns = columns or self._columns(db, table_name)
+            cur = db.execute(
+                "SELECT "
+                + ", ".join(f"group_concat(DISTINCT typeof({c}))" for c in columns)
+                + f" FROM {table_name};"
+            )
+            sqlite_types = [set((types or "").split(",")) for types in cur.fetchone()]
+            cur = self.select(db, table_name, columns)
+            return encode_arrow(cur, sqlite_types, ARROW_BATCH_ROWS)
+
+    def search(self, path, query, limit):
+        """search the notes of a collection, (re)building its index if stale"""
+        from . import search
+
+        return {
+            "path": path,
+            "q": query,
+            "results": search.search(self.index(path), query, limit),
+        }
+
+    def index(self, path):
+        """the path to the search index of a collection, (re)built if stale"""
+        from . import search
+
+        key = stat_key(self.root_path / path)
+
+        if key is None:
+            raise ValueError(f"{path} not found")
+
+        index_path = self._search_index_path(key[0])
+
+        if not search.is_fresh(index_path, key[1]):
+            self.log_(f"indexing {path}")
+            with self.open(path) as db:
+                search.build(db, index_path, key[1])
+
+        return index_path
+
+    def _search_index_path(self, resolved):
+        return self.search_path / f"{digest(resolved)}.sqlite3"
+
+    def invalidate(self, path):
+        """remove the files derived from a collection: extracted copies, and its
+        archive and search indexes
+
+        returns whether it had a search index
+        """
+        resolved = str((self.root_path / path).resolve())
+        search_index_path = self._search_index_path(resolved)
+        had_index = search_index_path.exists()
+        self.extracted.discard(digest(resolved))
+
+        for derived in [search_index_path, self._archive_index_path(resolved)]:
+            try:
+                derived.unlink()
+            except FileNotFoundError:
+                pass
+
+        return had_index
+
+    def query(self, path, query, order, limit):
+        """read up to ``limit`` cards matching a ``query``, in ``order`` (then
+        ``id``), and their notes
+
+        ``order`` is a column of ``cards``, descending if it starts with ``-``
+        """
+        from .query import compile_query
+        from .write import in_chunks
+
+        where, params, needs_notes = compile_query(query)
+        column = order.lstrip("-")
+        direction = "DESC" if order.startswith("-") else "ASC"
+        join = "JOIN notes AS n ON n.id = c.nid" if needs_notes else ""
+
+        with self.open(path) as db:
+            if column not in self._columns(db, "cards"):
+                raise ValueError(f"cards has no column {column}")
+
+            cur = db.execute(
+                f"SELECT c.* FROM cards AS c {join} {where} "
+                f"ORDER BY c.{column} {direction}, c.id {direction} LIMIT ?;",
+                [*params, limit],
+            )
+            cards = {row["id"]: row for row in self.iter_rows(cur, "cards")}
+            nids = sorted({card["nid"] for card in cards.values()})
+            notes = {}
+
+            for chunk in in_chunks(nids):
+                cur = self.select(
+                    db,
+                    "notes",
+                    where=f"WHERE id IN ({', '.join('?' * len(chunk))})",
+                    params=chunk,
+                )
+                notes.update({row["id"]: row for row in self.iter_rows(cur, "notes")})
+
+        return {
+            "path": path,
+            "q": query,
+            "order": order,
+            "cards": cards,
+            "notes": notes,
+        }
+
+    def stats(self, path):
+        """aggregate the review statistics of a collection"""
+        from .stats import collection_stats
+
+        with self.open(path) as db:
+            return {"path": path, **collection_stats(db)}
+
+    def write(self, path, notes=(), cards=(), now=None):
+        """insert and update notes and cards in one transaction, at unix ``now``
+
+        the collection in a ``.apkg`` is written in a copy, and the archive then
+        atomically replaced
+        """
+        from .write import Writer
+
+        full_contents_path = self.root_path / path
+        now = time.time() if now is None else now
+
+        if not full_contents_path.exists():
+            raise ValueError(f"{path} not found")
+
+        if full_contents_path.suffix == ".anki2":
+            with closing(self._connect(full_contents_path)) as db:
+                return {"path": path, **Writer(db, now).write(notes, cards)}
+
+        if full_contents_path.suffix != ".apkg":
+            raise ValueError(f"{path} was not recognized")
+
+        # another worker, process or server may be writing the same archive
+        with self._archive_lock(full_contents_path):
+            result = self._write_apkg(full_contents_path, notes, cards, now)
+
+        return {"path": path, **result}
+
+    def _write_apkg(self, apkg_path, notes, cards, now):
+        from .write import Writer
+
+        members = self._collection_members(apkg_path)
+
+        if not members:
+            raise ValueError(f"{apkg_path.name} has no collection")
+
+        # hidden, so neither cataloged nor watched, and on the same filesystem
+        with tempfile.TemporaryDirectory(prefix=".janki-", dir=apkg_path.parent) as td:
+            db_path = Path(td) / "collection.anki2"
+
+            with archive.open_member(apkg_path, members[0]) as source:
+                with db_path.open("wb") as dest:
+                    shutil.copyfileobj(source, dest, CHUNK_SIZE)
+
+            with closing(self._connect(db_path)) as db:
+                result = Writer(db, now).write(notes, cards)
+
+            tmp_path = Path(td) / apkg_path.name
+            archive.repackage(apkg_path, tmp_path, {members[0].filename: db_path})
+            os.replace(tmp_path, apkg_path)
+
+        return result
+
+    def _archive_lock(self, apkg_path):
+        """an exclusive lock on an archive, held while it is rewritten"""
+        private_dir(self.locks_path)
+        resolved = str(apkg_path.resolve())
+        return file_lock(self.locks_path / f"{digest(resolved)}.lock")
+
+    def scan(self):
+        """find the collections under ``root_dir``, and their freshness"""
+        from . import catalog
+
+        return catalog.scan(self.root_path)
+
+    def read_catalog(self):
+        """the persisted catalog entries of ``root_dir``, by path"""
+        from . import catalog
+
+        return catalog.read(self.catalog_path, str(self.root_path.resolve()))
+
+    def write_catalog(self, entries):
+        from . import catalog
+
+        catalog.write(self.catalog_path, str(self.root_path.resolve()), entries)
+
+    def summarize(self, path):
+        """count the cards, notes and reviews of a collection, and name its decks"""
+        from .catalog import summarize
+
+        with self.open(path) as db:
+            return {"path": path, **summarize(db)}
+
+    def forecast(self, path, days, now, **options):
+        """simulate the reviews due on each of the next ``days``, from unix ``now``"""
+        from . import forecast
+
+        with self.open(path) as db:
+            cards = forecast.read_cards(db)
+            today = forecast.today(db, now)
+
+        return {
+            "path": path,
+            "today": today,
+            "days": days,
+            **forecast.simulate(**cards, today=today, days=days, **options),
+        }
+
+    def page(self, path, table_name, after, limit, sort):
+        """read up to ``limit`` rows of a table, after the ``after`` cursor"""
+        if table_name not in TABLE_NAMES:
+            raise ValueError(f"{table_name} is not a table")
+
+        with self.open(path) as db:
+            columns = self._columns(db, table_name)
+
+            if "id" not in columns:
+                raise ValueError(f"{table_name} has no id")
+
+            if sort not in columns:
+                raise ValueError(f"{table_name} has no column {sort}")
+
+            keys = ["id"] if sort == "id" else [sort, "id"]
+            where = ""
+            params = []
+
+            if after is not None:
+                params = decode_cursor(after, len(keys))
+                where = f"WHERE ({', '.join(keys)}) > ({', '.join('?' * len(keys))})"
+
+            cur = db.execute(
+                f"SELECT * FROM {table_name} {where} "
+                f"ORDER BY {', '.join(keys)} LIMIT ?;",
+                [*params, limit + 1],
+            )
+
+            rows = [*self.iter_rows(cur, table_name)]
+
+        next_cursor = None
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][key] for key in keys])
+
+        return {
+            "path": path,
+            "table": table_name,
+            "sort": sort,
+            "rows": rows,
+            "next": next_cursor,
+        }
+
+    def changes(self, path, since, projection=None):
+        """read the rows changed at or after ``since`` (in seconds), and the ids of
+        deleted rows which are still recorded in ``graves``
+
+        the ``watermark`` is the latest change, to use as the next ``since``
+        """
+        projection = projection or make_projection()
+        result = {"path": path, "since": since, "watermark": since, "deleted": {}}
+
+        with self.open(path) as db:
+            for table_name, columns in projection:
+                column, per_second = CHANGE_COLUMNS[table_name]
+                where = f"WHERE {column} >= ?"
+                cur = self.select(db, table_name, columns, where, [since * per_second])
+                result[table_name] = {
+                    row["id"]: row for row in self.iter_rows(cur, table_name)
+                }
+
+                cur = db.execute(f"SELECT MAX({column}) FROM {table_name};")
+                latest = (cur.fetchone()[0] or 0) // per_second
+                result["watermark"] = max(result["watermark"], latest)
+
+            for table_name, columns in projection:
+                if table_name in GRAVE_TYPES:
+                    result["deleted"][table_name] = self._deleted(db, table_name)
+
+        return result
+
+    def _deleted(self, db, table_name):
+        """the ids in ``graves`` which are no longer in a table"""
+        if not self._columns(db, "graves"):
+            return []
+
+        cur = db.execute(
+            "SELECT oid FROM graves WHERE type = ? "
+            f"AND oid NOT IN (SELECT id FROM {table_name});",
+            [GRAVE_TYPES[table_name]],
+        )
+        return [oid for (oid,) in cur]
+
+    def _columns(self, db, table_name):
+        return [row[1] for row in db.execute(f"PRAGMA table_info({table_name});")]
+
+    def log_(self, *args, **kwargs):
+        self.log.warning(f"🃏 {args[0]}", *args[1:], **kwargs)
@@ -1,6 +1,7 @@
 # Copyright (c) 2021 University System of Georgia and janki contributors
 # Distributed under the terms of the BSD-3-Clause License.
 
+import json
 import shutil
 import zipfile
 from pathlib import Path
@@ -11,6 +12,9 @@ HERE = Path(__file__).parent
 FIXTURES = HERE / "fixtures"
 # TODO: once packaged, use the one from ankipandas
 TEST_COLLECTION = FIXTURES / "collection_v1.anki2"
+# numbered `.apkg` media members, and the names they are mapped to
+TEST_MEDIA = {"0": b"hello world" * 100, "1": b"\x89PNG\r\n\x1a\n"}
+TEST_MEDIA_MAP = {"0": "hello world.txt", "1": "pixel.png"}
 
 pytest_plugins = [
     "jupyter_server.pytest_plugin",
@@ -18,10 +22,14 @@ pytest_plugins = [
 
 
 @pytest.fixture
-def jp_server_config(jp_server_config):
+def jp_server_config(jp_server_config, tmp_path):
     return {
         "ServerApp": {"jpserver_extensions": {"janki": True}},
-        "JankiManager": {"strict": True},
+        "JankiManager": {
+            "strict": True,
+            "cache_dir": str(tmp_path / "janki-cache"),
+            "catalog_prewarm": False,
+        },
     }
 
 
@@ -48,6 +56,9 @@ def jk_collection(jp_root_dir):
             with zipfile.ZipFile(dest, "w") as zip_file:
                 with zip_file.open("collection.anki2", "w") as collection:
                     collection.write(TEST_COLLECTION.read_bytes())
+                zip_file.writestr("media", json.dumps(TEST_MEDIA_MAP))
+                for member, content in TEST_MEDIA.items():
+                    zip_file.writestr(member, content, zipfile.ZIP_DEFLATED)
         return dest
 
     return inner
@@ -1,7 +1,15 @@
 # Copyright (c) 2021 University System of Georgia and janki contributors
 # Distributed under the terms of the BSD-3-Clause License.
 
+import gzip
+import json
+import mimetypes
+import os
+
 import pytest
+from tornado.httpclient import HTTPClientError
+
+from .conftest import TEST_MEDIA, TEST_MEDIA_MAP
 
 
 def test_trait(jp_serverapp, jk_manager):
@@ -20,3 +28,452 @@ async def test_good_collection(contents_path, jk_manager, jk_collection, jp_fetc
     # TODO: check again with ankipandas >=0.3.11
     # for ext in ["shm", "wal"]:
     #     assert not (db.parent / f"{db.name}-{ext}").exists()
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_stream_collection(contents_path, jp_serverapp, jk_collection, jp_fetch):
+    jk_collection(contents_path)
+    manager = jp_serverapp.janki_manager
+    manager.stream_chunk_rows = 2
+    whole = await jp_fetch("janki", "collection", contents_path)
+    streamed = await jp_fetch(
+        "janki", "collection", contents_path, params={"stream": "1"}
+    )
+    assert streamed.code == 200
+    assert json.loads(streamed.body) == json.loads(whole.body)
+    manager.validate(json.loads(streamed.body))
+
+
+@pytest.mark.parametrize("stream", ["0", "1"])
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_columnar_collection(
+    contents_path, stream, jp_serverapp, jk_collection, jp_fetch
+):
+    jk_collection(contents_path)
+    manager = jp_serverapp.janki_manager
+    manager.stream_chunk_rows = 2
+    whole = json.loads((await jp_fetch("janki", "collection", contents_path)).body)
+    params = dict(format="columnar", stream=stream)
+    response = await jp_fetch("janki", "collection", contents_path, params=params)
+    columnar = json.loads(response.body)
+    manager.validate(columnar, fmt="columnar")
+    assert len(response.body) < len(json.dumps(whole))
+    for table_name, rows in whole.items():
+        if table_name == "path":
+            continue
+        table = columnar[table_name]
+        assert {
+            str(row["id"]): row
+            for row in [dict(zip(table["columns"], values)) for values in table["rows"]]
+        } == rows
+
+
+@pytest.mark.parametrize("stream", ["0", "1"])
+async def test_bad_format(stream, jk_collection, jp_fetch):
+    jk_collection("foo.anki2")
+    params = dict(format="nope", stream=stream)
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "collection", "foo.anki2", params=params)
+    assert info.value.code == 400
+
+
+@pytest.mark.parametrize("fmt", ["objects", "columnar"])
+@pytest.mark.parametrize(
+    "params,headers",
+    [
+        ({"encoding": "msgpack"}, {}),
+        ({}, {"Accept": "application/json;q=0.5, application/msgpack"}),
+    ],
+)
+async def test_msgpack_collection(fmt, params, headers, jk_collection, jp_fetch):
+    msgpack = pytest.importorskip("msgpack")
+    jk_collection("foo.anki2")
+    params = dict(params, format=fmt)
+    whole = await jp_fetch("janki", "collection", "foo.anki2", params=dict(format=fmt))
+    response = await jp_fetch(
+        "janki", "collection", "foo.anki2", params=params, headers=dict(headers)
+    )
+    assert response.headers["Content-Type"] == "application/msgpack"
+    assert "Accept" in response.headers["Vary"]
+    assert msgpack.unpackb(response.body) == json.loads(whole.body)
+    assert len(response.body) < len(whole.body)
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_arrow_table(contents_path, jk_collection, jp_fetch):
+    pa = pytest.importorskip("pyarrow")
+    jk_collection(contents_path)
+    for table_name in ["cards", "col", "notes", "revlog"]:
+        params = dict(encoding="arrow", tables=table_name, format="columnar")
+        whole = await jp_fetch("janki", "collection", contents_path, params=params)
+        params.pop("encoding")
+        table = json.loads(
+            (await jp_fetch("janki", "collection", contents_path, params=params)).body
+        )[table_name]
+        arrow = pa.ipc.open_stream(whole.body).read_all()
+        assert arrow.column_names == table["columns"]
+        assert arrow.num_rows == len(table["rows"])
+        if table_name != "col":
+            assert arrow.to_pylist() == [
+                dict(zip(table["columns"], row)) for row in table["rows"]
+            ]
+
+
+@pytest.mark.parametrize(
+    "params,code", [({"encoding": "nope"}, 400), ({"encoding": "arrow"}, 400)]
+)
+async def test_bad_encoding(params, code, jk_collection, jp_fetch):
+    pytest.importorskip("pyarrow")
+    jk_collection("foo.anki2")
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "collection", "foo.anki2", params=params)
+    assert info.value.code == code
+
+
+@pytest.mark.parametrize("sort", ["id", "due"])
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_table_pages(contents_path, sort, jk_collection, jp_fetch):
+    jk_collection(contents_path)
+    whole = json.loads((await jp_fetch("janki", "collection", contents_path)).body)
+    params = {"limit": "5", "sort": sort}
+    rows = []
+
+    while True:
+        response = await jp_fetch(
+            "janki", "collection", contents_path, "cards", params=params
+        )
+        page = json.loads(response.body)
+        assert len(page["rows"]) <= 5
+        rows += page["rows"]
+        if page["next"] is None:
+            break
+        params["after"] = page["next"]
+
+    assert len(rows) == len(whole["cards"])
+    assert rows == sorted(rows, key=lambda row: (row[sort], row["id"]))
+    assert {str(row["id"]): row for row in rows} == whole["cards"]
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"sort": "nope"},
+        {"after": "nope"},
+        {"sort": "due", "after": "1"},
+        {"limit": "0"},
+        {"limit": "-1"},
+    ],
+)
+async def test_table_bad_page(params, jk_collection, jp_fetch):
+    jk_collection("foo.anki2")
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "collection", "foo.anki2", "cards", params=params)
+    assert info.value.code == 400
+
+
+@pytest.mark.parametrize("stream", ["0", "1"])
+@pytest.mark.parametrize(
+    "params,expected",
+    [
+        ({"tables": "cards,notes"}, {"cards": None, "notes": None}),
+        ({"fields": "cards.due"}, {"cards": {"id", "due"}}),
+        ({"tables": "col", "fields": "col.models"}, {"col": {"id", "models"}}),
+    ],
+)
+async def test_projected_collection(params, expected, stream, jk_collection, jp_fetch):
+    jk_collection("foo.anki2")
+    params = dict(params, stream=stream)
+    response = await jp_fetch("janki", "collection", "foo.anki2", params=params)
+    collection = json.loads(response.body)
+    assert set(collection) == {"path", *expected}
+
+    for table_name, columns in expected.items():
+        for row in collection[table_name].values():
+            assert columns is None or set(row) == columns
+
+
+@pytest.mark.parametrize("stream", ["0", "1"])
+async def test_bad_projected_collection(stream, jk_collection, jp_fetch):
+    jk_collection("foo.anki2")
+    params = dict(fields="cards.nope", stream=stream)
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "collection", "foo.anki2", params=params)
+    assert info.value.code == 400
+
+
+@pytest.mark.parametrize("table", [None, "cards"])
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_not_modified(contents_path, table, jk_collection, jp_fetch):
+    db = jk_collection(contents_path)
+    url = ["janki", "collection", contents_path, *([table] if table else [])]
+    response = await jp_fetch(*url)
+    etag = response.headers["Etag"]
+    modified = response.headers["Last-Modified"]
+
+    for headers in [{"If-None-Match": etag}, {"If-Modified-Since": modified}]:
+        response = await jp_fetch(*url, headers=headers, raise_error=False)
+        assert response.code == 304
+        assert not response.body
+
+    projected = await jp_fetch(*url, params={"limit": "1", "tables": "cards"})
+    assert projected.headers["Etag"] != etag
+
+    stat = db.stat()
+    os.utime(db, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    response = await jp_fetch(*url, headers={"If-None-Match": etag})
+    assert response.code == 200
+    assert response.headers["Etag"] != etag
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_changes(contents_path, jk_collection, jp_fetch):
+    jk_collection(contents_path)
+    url = ["janki", "collection", contents_path]
+    whole = json.loads((await jp_fetch(*url)).body)
+    changes = json.loads((await jp_fetch(*url, "changes")).body)
+
+    for table_name in ["cards", "notes", "col", "revlog"]:
+        assert changes[table_name] == whole[table_name]
+
+    assert changes["deleted"]["notes"]
+    assert not set(changes["deleted"]["notes"]) & {int(n) for n in whole["notes"]}
+
+    params = {"since": str(changes["watermark"]), "tables": "cards,notes"}
+    changes = json.loads((await jp_fetch(*url, "changes", params=params)).body)
+    assert set(changes["cards"]) == {
+        cid
+        for cid, card in whole["cards"].items()
+        if card["mod"] >= int(params["since"])
+    }
+    assert "col" not in changes
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+@pytest.mark.parametrize(
+    "q,expected",
+    [
+        ("baum", [1557223232204]),
+        ("grun", [1557223253254]),
+        ("tags:color", [1557223241471, 1557223253254]),
+        ("nothing", []),
+    ],
+)
+async def test_search(contents_path, q, expected, jk_collection, jp_fetch):
+    jk_collection(contents_path)
+    params = dict(q=q)
+    response = await jp_fetch(
+        "janki", "collection", contents_path, "search", params=params
+    )
+    search = json.loads(response.body)
+    assert sorted(r["id"] for r in search["results"]) == expected
+    for result in search["results"]:
+        assert result["cards"]
+        assert "<mark>" in result["snippet"] or q.startswith("tags:")
+
+
+@pytest.mark.parametrize(
+    "params", [{"q": '"'}, {}, {"q": "car", "limit": "0"}, {"q": "car", "limit": "-1"}]
+)
+async def test_bad_search(params, jk_collection, jp_fetch):
+    jk_collection("foo.anki2")
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "collection", "foo.anki2", "search", params=params)
+    assert info.value.code == 400
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+@pytest.mark.parametrize(
+    "params,expected",
+    [
+        ({}, 12),
+        (
+            {"q": "deck:1 queue:review", "order": "-due"},
+            [1555579360346, 1555579345401, 1555579360345],
+        ),
+        ({"q": "tag:color -due>5"}, [1557223253246, 1557223253247]),
+        ({"q": "tag:adj* mid:1555579331146", "limit": "1"}, [1557223232194]),
+        ({"q": "due:4..5 deck:1"}, []),
+    ],
+)
+async def test_query(contents_path, params, expected, jk_collection, jp_fetch):
+    jk_collection(contents_path)
+    response = await jp_fetch(
+        "janki", "collection", contents_path, "query", params=params
+    )
+    query = json.loads(response.body)
+    cards = [*query["cards"].values()]
+    if isinstance(expected, int):
+        assert len(cards) == expected
+    else:
+        assert [card["id"] for card in cards] == expected
+    assert {str(card["nid"]) for card in cards} == set(query["notes"])
+
+
+@pytest.mark.parametrize(
+    "params", [{"q": "deck:nope"}, {"order": "nope"}, {"limit": "0"}, {"limit": "-5"}]
+)
+async def test_bad_query(params, jk_collection, jp_fetch):
+    jk_collection("foo.anki2")
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "collection", "foo.anki2", "query", params=params)
+    assert info.value.code == 400
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_stats(contents_path, jk_collection, jp_fetch):
+    jk_collection(contents_path)
+    response = await jp_fetch("janki", "collection", contents_path, "stats")
+    stats = json.loads(response.body)
+    assert sum(day["reviews"] for day in stats["days"]) == 6
+    assert {*stats} == {"path", "days", "retention", "ease", "time", "buttons"}
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_forecast(contents_path, jk_collection, jp_fetch):
+    jk_collection(contents_path)
+    params = dict(days="10", retention="1")
+    response = await jp_fetch(
+        "janki", "collection", contents_path, "forecast", params=params
+    )
+    forecast = json.loads(response.body)
+    assert len(forecast["reviews"]) == len(forecast["new"]) == 10
+    # 3 overdue reviews, and 9 new cards on the first day
+    assert forecast["new"][0] == 9
+    assert forecast["reviews"][0] == 3 + 9
+
+
+@pytest.mark.parametrize(
+    "params", [{"days": "-1"}, {"days": "0"}, {"retention": "2"}, {"new": "x"}]
+)
+async def test_bad_forecast(params, jk_collection, jp_fetch):
+    jk_collection("foo.anki2")
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "collection", "foo.anki2", "forecast", params=params)
+    assert info.value.code == 400
+
+
+@pytest.mark.parametrize(
+    "name,range_header,code,expected",
+    [
+        ("hello world.txt", None, 200, slice(None)),
+        ("pixel.png", None, 200, slice(None)),
+        ("hello world.txt", "bytes=0-9", 206, slice(0, 10)),
+        ("hello world.txt", "bytes=1095-", 206, slice(1095, None)),
+        ("hello world.txt", "bytes=-5", 206, slice(-5, None)),
+        ("hello world.txt", "lines=1-2", 200, slice(None)),
+    ],
+)
+async def test_media(name, range_header, code, expected, jk_collection, jp_fetch):
+    jk_collection("foo/baz.apkg")
+    member = {v: k for k, v in TEST_MEDIA_MAP.items()}[name]
+    headers = {"Range": range_header} if range_header else {}
+    response = await jp_fetch("janki", "package", "foo/baz.apkg", name, headers=headers)
+    assert response.code == code
+    assert response.body == TEST_MEDIA[member][expected]
+    assert response.headers["Content-Type"] == mimetypes.guess_type(name)[0]
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    etag = response.headers["Etag"]
+    headers = {"If-None-Match": etag}
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "package", "foo/baz.apkg", name, headers=headers)
+    assert info.value.code == 304
+
+
+@pytest.mark.parametrize(
+    "path,name,headers,code",
+    [
+        ("foo/baz.apkg", "nope.png", {}, 404),
+        ("foo/nope.apkg", "pixel.png", {}, 404),
+        ("foo/baz.apkg", "pixel.png", {"Range": "bytes=100-"}, 416),
+    ],
+)
+async def test_bad_media(path, name, headers, code, jk_collection, jp_fetch):
+    jk_collection("foo/baz.apkg")
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "package", path, name, headers=headers)
+    assert info.value.code == code
+
+
+async def test_catalog(jp_serverapp, jk_collection, jp_fetch):
+    jk_collection("foo/baz.apkg")
+    await jp_serverapp.janki_manager.refresh_catalog()
+    response = await jp_fetch("janki", "catalog")
+    catalog = json.loads(response.body)
+    assert [c["path"] for c in catalog["collections"]] == ["foo/baz.apkg"]
+    assert catalog["collections"][0]["notes"] == 7
+
+
+async def test_write(jk_collection, jp_fetch):
+    jk_collection("foo/baz.apkg")
+    notes = [{"id": 1555579337683, "flds": ["Front", "Back"], "tags": " written "}]
+    body = json.dumps({"notes": notes})
+    response = await jp_fetch(
+        "janki", "collection", "foo/baz.apkg", method="POST", body=body
+    )
+    written = json.loads(response.body)
+    assert written["notes"] == [1555579337683]
+    assert written["cards"] == []
+
+    response = await jp_fetch("janki", "collection", "foo/baz.apkg")
+    note = json.loads(response.body)["notes"]["1555579337683"]
+    assert (note["sfld"], note["tags"], note["usn"]) == ("Front", " written ", -1)
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "[]",
+        "{",
+        json.dumps({"cards": [{"nid": 1}]}),
+        json.dumps({"cards": [{"nid": 42, "did": 999, "ord": 0}]}),
+        json.dumps({"notes": [1]}),
+        json.dumps({"notes": [{"mid": 7, "flds": 5}]}),
+    ],
+)
+async def test_bad_write(body, jk_collection, jp_fetch):
+    jk_collection("foo/baz.apkg")
+    with pytest.raises(HTTPClientError) as info:
+        await jp_fetch("janki", "collection", "foo/baz.apkg", method="POST", body=body)
+    assert info.value.code == 400
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected",
+    [
+        ("gzip", "gzip"),
+        ("br;q=1, gzip;q=0.5", "gzip"),
+        ("*;q=0.1", "gzip"),
+        ("gzip;q=0", None),
+        ("identity", None),
+    ],
+)
+@pytest.mark.parametrize("suffix", [[], ["stats"]])
+async def test_content_coding(
+    accept_encoding, expected, suffix, jp_serverapp, jk_collection, jp_fetch
+):
+    jk_collection("foo.anki2")
+    jp_serverapp.janki_manager.compress_min_bytes = 0
+    path = ["janki", "collection", "foo.anki2", *suffix]
+
+    async def fetch(accept_encoding):
+        # otherwise, the client only sends `Accept-Encoding: gzip`
+        return await jp_fetch(
+            *path,
+            headers={"Accept-Encoding": accept_encoding},
+            decompress_response=False,
+        )
+
+    identity = await fetch("identity")
+    responses = [await fetch(accept_encoding) for i in range(2)]
+    for response in responses:
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert response.headers.get("Content-Encoding") == expected
+        body = gzip.decompress(response.body) if expected else response.body
+        assert body == identity.body
+    assert responses[0].headers["Etag"] == responses[1].headers["Etag"]
+    assert (responses[0].headers["Etag"] == identity.headers["Etag"]) == (not expected)
+    compressed = [
+        k for k in jp_serverapp.janki_manager.cache if k[2][0] == "compressed"
+    ]
+    assert len(compressed) == (1 if expected else 0)
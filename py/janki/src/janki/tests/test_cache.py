@@ -0,0 +1,60 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import os
+import stat
+
+import pytest
+
+from janki.cache import PayloadCache, atomic_write
+
+
+@pytest.fixture
+def jk_umask():
+    umask = os.umask(0o022)
+    yield
+    os.umask(umask)
+
+
+@pytest.mark.parametrize(
+    "shared,dir_mode,file_mode",
+    [(True, 0o2770, 0o660), (False, 0o700, 0o600)],
+)
+def test_payload_modes(shared, dir_mode, file_mode, jk_umask, tmp_path):
+    payloads = PayloadCache(tmp_path / "payloads", 1024, shared=shared)
+
+    with payloads.lock("foo"):
+        payloads.put_bytes("foo", b"bar")
+
+    assert stat.S_IMODE(payloads.path.stat().st_mode) == dir_mode
+    locks = [*payloads.path.glob(".lock-*")]
+    assert [stat.S_IMODE(p.stat().st_mode) for p in locks] == [file_mode]
+    if shared:
+        assert stat.S_IMODE((payloads.path / "foo").stat().st_mode) == file_mode
+
+
+def test_payload_of_another_user(monkeypatch, tmp_path):
+    payloads = PayloadCache(tmp_path / "payloads", 1024, shared=True)
+    payloads.put_bytes("foo", b"bar")
+
+    def utime(path):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(os, "utime", utime)
+    assert payloads.get_bytes("foo") == b"bar"
+
+
+def test_atomic_write(tmp_path):
+    path = tmp_path / "sub" / "data.json"
+
+    with atomic_write(path) as tmp:
+        tmp.write_text("1")
+        assert not path.exists()
+    assert path.read_text() == "1"
+
+    with pytest.raises(ValueError):
+        with atomic_write(path) as tmp:
+            tmp.write_text("2")
+            raise ValueError("nope")
+    assert path.read_text() == "1"
+    assert [p.name for p in path.parent.iterdir()] == ["data.json"]
@@ -0,0 +1,46 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import numpy as np
+import pytest
+
+from janki.forecast import simulate
+
+
+def test_forecast_pass():
+    # due in 2 days, then 10 * 2.5 days later
+    forecast = simulate([2], [7], [10], [2500], today=5, days=30, retention=1)
+    assert np.flatnonzero(forecast["reviews"]).tolist() == [2, 27]
+    assert sum(forecast["new"]) == 0
+
+
+def test_forecast_lapse():
+    # overdue, lapses, then is due every day
+    forecast = simulate([2], [0], [10], [2500], today=5, days=5, retention=0)
+    assert forecast["reviews"] == [1, 1, 1, 1, 1]
+
+
+@pytest.mark.parametrize("new_per_day,expected", [(0, [0, 0, 0]), (2, [2, 2, 1])])
+def test_forecast_new(new_per_day, expected):
+    queue = [0, 0, 0, 0, 0, -1, 1]
+    forecast = simulate(
+        queue, range(7), [0] * 7, [0] * 7, today=0, days=3, new_per_day=new_per_day
+    )
+    assert forecast["new"] == expected
+    # the learning card, and the new cards, are reviewed at least once
+    assert sum(forecast["reviews"]) >= 1 + sum(expected)
+
+
+def test_forecast_many():
+    rng = np.random.default_rng(0)
+    n = 100_000
+    forecast = simulate(
+        rng.choice([-1, 0, 1, 2], n),
+        rng.integers(0, 100, n),
+        rng.integers(1, 100, n),
+        rng.integers(1300, 3000, n),
+        today=50,
+        days=365,
+    )
+    assert len(forecast["reviews"]) == 365
+    assert forecast["reviews"][0] > 0
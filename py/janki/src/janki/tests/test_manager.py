@@ -0,0 +1,474 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+
+import jsonschema
+import pytest
+
+from janki import search
+from janki.cache import stat_key
+from janki.constants import TABLE_NAMES
+
+from .conftest import TEST_MEDIA, TEST_MEDIA_MAP
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_cache_hit(contents_path, jk_manager, jk_collection):
+    jk_collection(contents_path)
+    first = await jk_manager.load(contents_path)
+    second = await jk_manager.load(contents_path)
+    assert first is second
+    assert len(jk_manager.cache) == 1
+
+
+async def test_cache_stale(jk_manager, jk_collection):
+    db = jk_collection("foo.anki2")
+    first = await jk_manager.load("foo.anki2")
+    stat = db.stat()
+    os.utime(db, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = await jk_manager.load("foo.anki2")
+    assert first is not second
+    assert first == second
+    assert len(jk_manager.cache) == 1
+
+
+async def test_cache_stale_wal(jk_manager, jk_collection):
+    db_path = jk_collection("foo.anki2")
+    first = await jk_manager.load("foo.anki2")
+    stat = db_path.stat()
+
+    # as anki does, keep changes in the write-ahead log, until closed
+    with closing(sqlite3.connect(str(db_path))) as db:
+        db.execute("PRAGMA wal_autocheckpoint = 0;")
+        db.execute("UPDATE notes SET tags = ' edited ';")
+        db.commit()
+        assert (db_path.stat().st_mtime_ns, db_path.stat().st_size) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        )
+        second = await jk_manager.load("foo.anki2")
+
+    assert second != first
+    assert {note["tags"] for note in second["notes"].values()} == {" edited "}
+
+
+async def test_cache_limits(jk_manager, jk_collection):
+    jk_manager.cache_max_entries = 1
+    for path in ["foo.anki2", "bar.anki2"]:
+        jk_collection(path)
+        await jk_manager.load(path)
+    assert len(jk_manager.cache) == 1
+    jk_manager.cache_max_bytes = 0
+    assert len(jk_manager.cache) == 0
+
+
+@pytest.mark.parametrize(
+    "tables,fields,expected",
+    [
+        (None, None, [(t, None) for t in TABLE_NAMES]),
+        (["notes", "cards"], None, [("cards", None), ("notes", None)]),
+        (None, ["cards.due", "cards.id"], [("cards", ("due", "id"))]),
+        (["col", "cards"], ["cards.due"], [("cards", ("due",)), ("col", None)]),
+    ],
+)
+def test_projection(tables, fields, expected, jk_manager):
+    assert jk_manager.projection(tables, fields) == tuple(expected)
+
+
+@pytest.mark.parametrize(
+    "tables,fields",
+    [(["nope"], None), (None, ["cards"]), (["notes"], ["cards.id"])],
+)
+def test_bad_projection(tables, fields, jk_manager):
+    with pytest.raises(ValueError):
+        jk_manager.projection(tables, fields)
+
+
+async def test_extract_cache(jk_manager, jk_collection):
+    apkg = jk_collection("foo/baz.apkg")
+    extracted = Path(jk_manager.cache_dir) / "extracted"
+    # payloads would be reused, as the contents are unchanged
+    jk_manager.payload_cache_max_bytes = 0
+    await jk_manager.load("foo/baz.apkg")
+    first = [*extracted.glob("*.anki2")]
+    assert len(first) == 1
+
+    jk_manager.cache.clear()
+    await jk_manager.load("foo/baz.apkg")
+    assert [*extracted.glob("*.anki2")] == first
+
+    stat = apkg.stat()
+    os.utime(apkg, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    await jk_manager.load("foo/baz.apkg")
+    second = [*extracted.glob("*.anki2")]
+    assert len(second) == 1
+    assert second != first
+
+
+def test_extract_evicted(jk_manager, jk_collection):
+    jk_collection("foo/baz.apkg")
+    store = jk_manager.store
+    assert store.summarize("foo/baz.apkg")["notes"] == 7
+    extracted = [*store.extracted.path.iterdir()]
+    assert [p.suffix for p in extracted] == [".anki2"]
+
+    # another process evicts the copy, between finding and opening it
+    get = store.extracted.get
+
+    def get_evicted(name):
+        path = get(name)
+        path.unlink()
+        return path
+
+    store.extracted.get = get_evicted
+    assert store.summarize("foo/baz.apkg")["notes"] == 7
+    assert [*store.extracted.path.iterdir()] == extracted
+
+
+async def test_archive_index(jk_manager, jk_collection):
+    apkg = jk_collection("foo/baz.apkg")
+    indexes = Path(jk_manager.cache_dir) / "archives"
+    await jk_manager.load("foo/baz.apkg")
+    index = [*indexes.glob("*.json")]
+    assert len(index) == 1
+    built = index[0].read_text()
+
+    async with jk_manager.open_media("foo/baz.apkg", TEST_MEDIA_MAP["0"]) as media:
+        fp, info = media
+        assert await jk_manager._run(fp.read) == TEST_MEDIA["0"]
+    assert index[0].read_text() == built
+
+    stat = apkg.stat()
+    os.utime(apkg, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    async with jk_manager.open_media("foo/baz.apkg", TEST_MEDIA_MAP["1"]) as media:
+        fp, info = media
+        assert await jk_manager._run(fp.read) == TEST_MEDIA["1"]
+    assert [*indexes.glob("*.json")] == index
+    assert index[0].read_text() != built
+
+
+async def test_extract_cache_disabled(jk_manager, jk_collection):
+    jk_collection("foo/baz.apkg")
+    jk_manager.extract_cache_max_bytes = 0
+    await jk_manager.load("foo/baz.apkg")
+    assert not (Path(jk_manager.cache_dir) / "extracted").exists()
+
+
+@pytest.mark.skipif(
+    not hasattr(sqlite3.Connection, "deserialize"), reason="needs python >=3.11"
+)
+async def test_apkg_in_memory(jk_manager, jk_collection):
+    jk_collection("foo/baz.apkg")
+    jk_collection("foo/bar.anki2")
+    jk_manager.apkg_strategy = "memory"
+    from_apkg = await jk_manager.load("foo/baz.apkg")
+    assert not (Path(jk_manager.cache_dir) / "extracted").exists()
+    from_anki2 = await jk_manager.load("foo/bar.anki2")
+    assert {**from_apkg, "path": None} == {**from_anki2, "path": None}
+
+
+@pytest.mark.parametrize("executor_kind", ["thread", "process"])
+async def test_executor(executor_kind, jk_manager, jk_collection):
+    jk_manager.executor_kind = executor_kind
+    paths = ["foo.anki2", "bar.anki2", "foo/baz.apkg"]
+    for path in paths:
+        jk_collection(path)
+    try:
+        responses = await asyncio.gather(*[jk_manager.load(path) for path in paths])
+    finally:
+        jk_manager.shutdown()
+    assert [r["path"] for r in responses] == paths
+    assert isinstance(
+        jk_manager.executor,
+        dict(thread=ThreadPoolExecutor, process=ProcessPoolExecutor)[executor_kind],
+    )
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_single_flight(contents_path, jk_manager, jk_collection):
+    jk_collection(contents_path)
+    store = jk_manager.store
+    loads = []
+
+    def load(*args):
+        loads.append(args)
+        return type(store).load(store, *args)
+
+    store.load = load
+    responses = await asyncio.gather(
+        *[jk_manager.load(contents_path) for i in range(5)]
+    )
+    assert len(loads) == 1
+    assert all(response is responses[0] for response in responses)
+    assert not jk_manager._loading
+
+
+@pytest.mark.parametrize("validation_engine", ["compiled", "jsonschema"])
+@pytest.mark.parametrize("fields", [None, ["cards.due"]])
+async def test_strict_validation(validation_engine, fields, jk_manager, jk_collection):
+    jk_collection("foo.anki2")
+    jk_manager.validation_engine = validation_engine
+    projection = jk_manager.projection(fields=fields)
+    response = await jk_manager.load("foo.anki2", projection)
+    jk_manager.validate(response, partial=fields is not None)
+    card = next(iter(response["cards"].values()))
+    bad = {**response, "cards": {card["id"]: {**card, "due": "soon"}}}
+    with pytest.raises(jsonschema.ValidationError):
+        jk_manager.validate(bad)
+
+
+async def test_search_index(jk_manager, jk_collection):
+    db = jk_collection("foo.anki2")
+    indexes = Path(jk_manager.cache_dir) / "search"
+    first = await jk_manager.search("foo.anki2", "car")
+    assert [r["id"] for r in first["results"]] == [1557223191575]
+    index = [*indexes.glob("*.sqlite3")]
+    assert len(index) == 1
+    built = index[0].stat().st_mtime_ns
+
+    await jk_manager.search("foo.anki2", "tree")
+    assert index[0].stat().st_mtime_ns == built
+
+    with sqlite3.connect(str(db)) as conn:
+        conn.execute("UPDATE notes SET flds = 'Bus\x1fBus' WHERE id = 1557223191575;")
+    conn.close()
+    assert not (await jk_manager.search("foo.anki2", "car"))["results"]
+    assert (await jk_manager.search("foo.anki2", "bus"))["results"]
+    assert [*indexes.glob("*.sqlite3")] == index
+
+
+async def test_search_snippet_escaped(jk_manager, jk_collection):
+    db = jk_collection("foo.anki2")
+    field = "zebra &lt;img src=x onerror=alert(1)&gt; zebra"
+
+    with sqlite3.connect(str(db)) as conn:
+        conn.execute("UPDATE notes SET flds = ? WHERE id = 1557223191575;", [field])
+    conn.close()
+
+    (result,) = (await jk_manager.search("foo.anki2", "zebra"))["results"]
+    assert result["snippet"] == (
+        "<mark>zebra</mark> &lt;img src=x onerror=alert(1)&gt; <mark>zebra</mark>"
+    )
+
+
+async def test_stats_cache(jk_manager, jk_collection):
+    db = jk_collection("foo.anki2")
+    first = await jk_manager.stats("foo.anki2")
+    assert first["buttons"]
+    assert await jk_manager.stats("foo.anki2") is first
+    stat = db.stat()
+    os.utime(db, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = await jk_manager.stats("foo.anki2")
+    assert second is not first
+    assert second == first
+
+
+async def test_catalog(jk_manager, jk_collection):
+    paths = ["foo.anki2", "foo/baz.apkg", ".hidden/bar.anki2"]
+    db, *_ = [jk_collection(path) for path in paths]
+    (db.parent / "not-a.anki2").write_bytes(b"nope")
+    store = jk_manager.store
+    summarized = []
+
+    def summarize(path):
+        summarized.append(path)
+        return type(store).summarize(store, path)
+
+    store.summarize = summarize
+    await jk_manager.refresh_catalog()
+    catalog = await jk_manager.catalog()
+    assert not catalog["scanning"]
+    entries = {entry["path"]: entry for entry in catalog["collections"]}
+    assert sorted(entries) == ["foo.anki2", "foo/baz.apkg", "not-a.anki2"]
+    assert entries["foo.anki2"]["cards"] == 12
+    assert entries["foo.anki2"]["decks"] == ["EnglishGerman", "Testing"]
+    assert entries["foo/baz.apkg"]["revlog"] == 6
+    assert "error" in entries["not-a.anki2"]
+
+    stat = db.stat()
+    os.utime(db, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    summarized.clear()
+    await jk_manager.refresh_catalog()
+    assert summarized == ["foo.anki2"]
+
+    # a new server reads the persisted catalog, and has nothing to summarize
+    restarted = type(jk_manager)(parent=jk_manager.parent)
+    restarted.store.summarize = summarize
+    summarized.clear()
+    await restarted.refresh_catalog()
+    assert not summarized
+    assert (await restarted.catalog())["collections"] == (await jk_manager.catalog())[
+        "collections"
+    ]
+
+
+async def test_rewarm(jk_manager, jk_collection):
+    apkg = jk_collection("foo/baz.apkg")
+    projection = jk_manager.projection(["cards"])
+    await jk_manager.load("foo/baz.apkg", projection)
+    await jk_manager.stats("foo/baz.apkg")
+    await jk_manager.search("foo/baz.apkg", "car")
+    stat = apkg.stat()
+    os.utime(apkg, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    await jk_manager.rewarm("foo/baz.apkg")
+    fingerprint = stat_key(apkg)[1]
+    assert sorted(map(repr, jk_manager.cache)) == sorted(
+        repr((str(apkg.resolve()), fingerprint, variant))
+        for variant in [(projection, "objects"), "stats"]
+    )
+    index = [*(Path(jk_manager.cache_dir) / "search").glob("*.sqlite3")]
+    assert search.is_fresh(index[0], fingerprint)
+
+
+@pytest.mark.parametrize("contents_path", ["foo.anki2", "foo/baz.apkg"])
+async def test_write(contents_path, jk_manager, jk_collection):
+    path = jk_collection(contents_path)
+    projection = jk_manager.projection(["notes"])
+    before = await jk_manager.load(contents_path, projection)
+    await jk_manager.search(contents_path, "car")
+
+    note = {"mid": 1555579331147, "flds": ["Wagen", "car"]}
+    written = await jk_manager.write(contents_path, notes=[note])
+    assert not [*path.parent.glob(".janki-*")]
+
+    after = await jk_manager.load(contents_path, projection)
+    assert len(after["notes"]) == len(before["notes"]) + 1
+    (nid,) = written["notes"]
+    assert after["notes"][nid]["sfld"] == "Wagen"
+    found = await jk_manager.search(contents_path, "Wagen")
+    assert [r["id"] for r in found["results"]] == [nid]
+
+    if path.suffix == ".apkg":
+        name = TEST_MEDIA_MAP["0"]
+        async with jk_manager.open_media(contents_path, name) as media:
+            fp, info = media
+            assert await jk_manager._run(fp.read) == TEST_MEDIA["0"]
+
+    with pytest.raises(ValueError):
+        await jk_manager.write(contents_path, notes=[{"flds": "no note type"}])
+
+
+def test_concurrent_apkg_writes(jk_manager, jk_collection):
+    jk_collection("foo/baz.apkg")
+    store = jk_manager.store
+
+    def write(i):
+        note = {"mid": 1555579331147, "flds": [f"Front {i}", "Back"]}
+        return store.write("foo/baz.apkg", notes=[note])
+
+    with ThreadPoolExecutor(4) as executor:
+        [*executor.map(write, range(8))]
+
+    assert store.summarize("foo/baz.apkg")["notes"] == 7 + 8
+
+
+async def test_watch(jk_manager, jk_collection):
+    db = jk_collection("foo.anki2")
+    jk_manager.watcher_kind = "poll"
+    jk_manager.watch_interval = jk_manager.watch_debounce = 0.05
+    await jk_manager.load("foo.anki2")
+    jk_manager.start_watching()
+
+    try:
+        await asyncio.sleep(0.2)
+        stat = db.stat()
+        os.utime(db, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        fingerprint = stat_key(db)[1]
+
+        for i in range(100):
+            await asyncio.sleep(0.05)
+            if [key for key in jk_manager.cache if key[1] == fingerprint]:
+                break
+        else:
+            assert False, "the collection was not rewarmed"
+    finally:
+        jk_manager.stop_watching()
+
+    assert len(jk_manager.cache) == 1
+
+
+@pytest.mark.parametrize("payload_compression", ["none", "gzip"])
+@pytest.mark.parametrize("fmt", ["objects", "columnar"])
+async def test_payload_cache(payload_compression, fmt, jk_manager, jk_collection):
+    jk_collection("foo.anki2")
+    jk_collection("copy/of/foo.anki2")
+    jk_manager.payload_compression = payload_compression
+    first = await jk_manager.load("foo.anki2", fmt=fmt)
+    payloads = Path(jk_manager.payload_cache_dir)
+    assert len([*payloads.glob("*.sha256")]) == 1
+
+    # a restarted server, or another process, reuses the payload, for any copy
+    restarted = type(jk_manager)(parent=jk_manager.parent)
+    restarted.payload_compression = payload_compression
+    store = restarted.store
+
+    def get_api_response(*args):
+        raise AssertionError("the payload was not reused")
+
+    store.get_api_response = get_api_response
+    second = await restarted.load("foo.anki2", fmt=fmt)
+    assert second == first
+    copied = await restarted.load("copy/of/foo.anki2", fmt=fmt)
+    assert copied == {**first, "path": "copy/of/foo.anki2"}
+
+
+def test_default_cache_dir(monkeypatch, jp_serverapp, tmp_path):
+    from ..manager import JankiManager
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    manager = JankiManager()
+    assert manager.cache_dir == str(tmp_path / "xdg" / "janki")
+
+
+@pytest.mark.parametrize(
+    "cache_mode,payload_mode,shared,ok",
+    [
+        (0o700, 0o700, False, True),
+        (0o755, 0o700, False, True),
+        (0o777, 0o700, False, False),
+        (0o770, 0o700, False, False),
+        (0o700, 0o770, False, False),
+        (0o700, 0o2770, True, True),
+        (0o700, 0o777, True, False),
+    ],
+)
+async def test_private_cache_dir(
+    cache_mode, payload_mode, shared, ok, tmp_path, jk_manager, jk_collection
+):
+    jk_collection("foo.anki2")
+    cache_dir = tmp_path / "private"
+    cache_dir.mkdir()
+    cache_dir.chmod(cache_mode)
+    payload_dir = tmp_path / "shared"
+    payload_dir.mkdir()
+    payload_dir.chmod(payload_mode)
+
+    async def load():
+        jk_manager.payload_cache_shared = shared
+        jk_manager.payload_cache_dir = str(payload_dir)
+        jk_manager.cache_dir = str(cache_dir)
+        return await jk_manager.load("foo.anki2")
+
+    if ok:
+        assert await load()
+        assert [*payload_dir.glob("*.sha256")]
+    else:
+        with pytest.raises(PermissionError):
+            await load()
+
+
+async def test_page_limit(jk_manager, jk_collection):
+    jk_collection("foo.anki2")
+    jk_manager.page_max_limit = 2
+    page = await jk_manager.page("foo.anki2", "cards", limit=5)
+    assert len(page["rows"]) == 2
+    for limit in [0, -3]:
+        with pytest.raises(ValueError):
+            await jk_manager.page("foo.anki2", "cards", limit=limit)
@@ -0,0 +1,37 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import pytest
+
+from janki.query import compile_query
+
+
+@pytest.mark.parametrize(
+    "query,where,params,needs_notes",
+    [
+        ("", "", [], False),
+        ("deck:1 queue:review", "WHERE c.did = ? AND c.queue = ?", [1, 2], False),
+        ("due:3..5", "WHERE c.due BETWEEN ? AND ?", [3, 5], False),
+        (
+            "-flag:0 due>=2",
+            "WHERE NOT ((c.flags & 7) = ?) AND c.due >= ?",
+            [0, 2],
+            False,
+        ),
+        (
+            "tag:a_b*",
+            "WHERE (' ' || n.tags || ' ') LIKE ? ESCAPE '\\'",
+            ["% a\\_b% %"],
+            True,
+        ),
+        ("mid:7", "WHERE n.mid = ?", [7], True),
+    ],
+)
+def test_compile_query(query, where, params, needs_notes):
+    assert compile_query(query) == (where, params, needs_notes)
+
+
+@pytest.mark.parametrize("query", ["deck:x", "nope:1", "due<x", "due:1..", "1; DROP"])
+def test_bad_query(query):
+    with pytest.raises(ValueError):
+        compile_query(query)
@@ -6,10 +6,12 @@ import pytest
 from hypothesis import HealthCheck, given, settings
 from hypothesis_jsonschema import from_schema
 
-from janki.schema import make_validator
+from janki.schema import CompiledValidator, make_validator
 
 validator = make_validator()
 
+compiled = CompiledValidator()
+
 schema = dict(**validator.schema)
 
 
@@ -17,9 +19,93 @@ schema = dict(**validator.schema)
 def test_validator(bad_example):
     with pytest.raises(jsonschema.ValidationError):
         validator.validate(bad_example)
+    with pytest.raises(jsonschema.ValidationError):
+        compiled.validate(bad_example)
 
 
 @settings(suppress_health_check=[HealthCheck.too_slow, HealthCheck.filter_too_much])
 @given(example=from_schema(schema))
 def test_validator_hypothesis(example):
     validator.validate(example)
+    compiled.validate(example)
+
+
+@pytest.fixture
+def jk_response():
+    card = schema["definitions"]["api-collection"]["properties"]["cards"]
+    card = card["additionalProperties"]["properties"]
+    empty = dict(integer=0, string="")
+    return {
+        "path": "foo.anki2",
+        "cards": {
+            str(i): {**{k: empty[v["type"]] for k, v in card.items()}, "id": i}
+            for i in range(100)
+        },
+        "col": {},
+        "notes": {},
+        "revlog": {},
+    }
+
+
+def test_compiled_bad_row(jk_response):
+    jk_response["cards"]["42"]["due"] = "soon"
+    validator.validate({**jk_response, "cards": {}})
+    with pytest.raises(jsonschema.ValidationError) as info:
+        compiled.validate(jk_response)
+    assert [*info.value.path] == ["cards", "42", "due"]
+
+
+def test_compiled_partial(jk_response):
+    jk_response.pop("notes")
+    with pytest.raises(jsonschema.ValidationError):
+        compiled.validate(jk_response)
+    compiled.validate(jk_response, partial=True)
+    jk_response["cards"] = []
+    with pytest.raises(jsonschema.ValidationError):
+        compiled.validate(jk_response, partial=True)
+
+
+@pytest.mark.parametrize(
+    "bad_row,sample,structural,raises",
+    [
+        ("42", 0, False, True),
+        ("42", 10, False, False),
+        ("40", 10, False, True),
+        ("40", 0, True, False),
+    ],
+)
+def test_compiled_sample(bad_row, sample, structural, raises, jk_response):
+    jk_response["cards"][bad_row]["due"] = "soon"
+    sampled = CompiledValidator(sample=sample, structural=structural)
+    if raises:
+        with pytest.raises(jsonschema.ValidationError):
+            sampled.validate(jk_response)
+    else:
+        sampled.validate(jk_response)
+
+
+@pytest.mark.parametrize(
+    "field,value",
+    [
+        ("decks", {"1": {"id": "not-an-int"}}),
+        ("dconf", {"1": {"id": "not-an-int"}}),
+        ("models", {"1": {"id": "not-an-int"}}),
+        ("conf", {"activeDecks": ["not-an-int"]}),
+    ],
+)
+def test_compiled_nested_json(field, value, jk_response):
+    jk_response["col"] = {
+        "1": {
+            **{k: 0 for k in ["id", "crt", "mod", "scm", "ver", "dty", "usn", "ls"]},
+            **{k: {} for k in ["conf", "models", "decks", "dconf", "tags"]},
+        }
+    }
+    validator.validate(jk_response)
+    compiled.validate(jk_response)
+
+    jk_response["col"]["1"][field] = value
+    with pytest.raises(jsonschema.ValidationError):
+        validator.validate(jk_response)
+    with pytest.raises(jsonschema.ValidationError) as info:
+        compiled.validate(jk_response)
+    assert [*info.value.path][:3] == ["col", "1", field]
@@ -0,0 +1,45 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import importlib.util
+import json
+
+import pytest
+
+from janki.serializers import JSONSerializer, OrjsonSerializer
+
+SERIALIZERS = [
+    JSONSerializer,
+    pytest.param(
+        OrjsonSerializer,
+        marks=pytest.mark.skipif(
+            importlib.util.find_spec("orjson") is None, reason="needs orjson"
+        ),
+    ),
+]
+
+
+@pytest.mark.parametrize("serializer_class", SERIALIZERS)
+def test_serializer(serializer_class):
+    serializer = serializer_class()
+    value = {1: {"id": 1, "flds": "a\x1fb", "conf": {"nested": [1.5, None]}}}
+    expected = json.loads(json.dumps(value))
+    assert json.loads(serializer.dumps(value)) == expected
+    assert json.loads(serializer.dumpb(value)) == expected
+    assert serializer.loads(json.dumps(expected)) == expected
+
+
+@pytest.mark.parametrize("serializer_class", SERIALIZERS)
+@pytest.mark.parametrize("stream", ["0", "1"])
+async def test_serializer_api(
+    serializer_class, stream, jp_serverapp, jk_collection, jp_fetch
+):
+    jk_collection("foo.anki2")
+    manager = jp_serverapp.janki_manager
+    manager.serializer_class = serializer_class
+    assert isinstance(manager.store.serializer, serializer_class)
+    response = await jp_fetch(
+        "janki", "collection", "foo.anki2", params=dict(stream=stream)
+    )
+    assert response.headers["Content-Type"].startswith("application/json")
+    manager.validate(json.loads(response.body))
@@ -0,0 +1,59 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import sqlite3
+
+import pytest
+
+from janki.stats import MS_PER_DAY, collection_stats
+
+
+@pytest.fixture
+def jk_reviews():
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE revlog (id, ease, lastIvl, time, type);")
+    db.execute("CREATE TABLE cards (factor, type);")
+    # (day, ease, lastIvl, time, type)
+    reviews = [
+        (0, 1, -600, 1000, 0),
+        (0, 3, 1, 2000, 1),
+        (1, 1, 3, 3000, 1),
+        (1, 4, 400, 4000, 1),
+        (2, 3, 5, 5000, 1),
+    ]
+    db.executemany(
+        "INSERT INTO revlog VALUES (?, ?, ?, ?, ?);",
+        [
+            (day * MS_PER_DAY + i, ease, last_ivl, time, type_)
+            for i, (day, ease, last_ivl, time, type_) in enumerate(reviews)
+        ],
+    )
+    db.executemany(
+        "INSERT INTO cards VALUES (?, ?);", [(2500, 2), (2650, 2), (1300, 2), (0, 0)]
+    )
+    return db
+
+
+def test_stats(jk_reviews):
+    stats = collection_stats(jk_reviews)
+    assert [
+        (d["day"], d["reviews"], d["correct"], d["time"]) for d in stats["days"]
+    ] == [
+        (0, 2, 1, 3000),
+        (1, 2, 1, 7000),
+        (2, 1, 1, 5000),
+    ]
+    assert stats["retention"] == [
+        {"min": 1, "max": 7, "reviews": 3, "correct": 2, "retention": 2 / 3},
+        {"min": 365, "max": None, "reviews": 1, "correct": 1, "retention": 1.0},
+    ]
+    assert stats["ease"] == [
+        {"factor": 1300, "cards": 1},
+        {"factor": 2500, "cards": 1},
+        {"factor": 2600, "cards": 1},
+    ]
+    assert stats["time"] == [
+        {"type": 0, "reviews": 1, "time": 1000},
+        {"type": 1, "reviews": 4, "time": 14000},
+    ]
+    assert len(stats["buttons"]) == 4
@@ -0,0 +1,46 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+from pathlib import Path
+
+import pytest
+
+from janki.watcher import PollingWatcher, collection_path
+
+ROOT = Path("/srv/decks")
+
+
+@pytest.mark.parametrize(
+    "path,expected",
+    [
+        ("/srv/decks/foo.anki2", "foo.anki2"),
+        ("/srv/decks/foo/baz.apkg", "foo/baz.apkg"),
+        ("/srv/decks/foo.anki2-wal", "foo.anki2"),
+        ("/srv/decks/foo.anki2-shm", None),
+        ("/srv/decks/.cache/foo.anki2", None),
+        ("/srv/other/foo.anki2", None),
+    ],
+)
+def test_collection_path(path, expected):
+    assert collection_path(ROOT, path) == expected
+
+
+async def test_polling_watcher():
+    scans = [
+        {"a.anki2": [1], "b.apkg": [1]},
+        {"a.anki2": [1], "b.apkg": [2], "c.anki2": [1]},
+        {"b.apkg": [2], "c.anki2": [1]},
+    ]
+    changed = []
+
+    async def scan():
+        return {path: {"fingerprint": f} for path, f in scans.pop(0).items()}
+
+    watcher = PollingWatcher(scan, changed.append, 60)
+
+    await watcher.poll()
+    assert changed == []
+    await watcher.poll()
+    assert changed == ["b.apkg", "c.anki2"]
+    await watcher.poll()
+    assert changed == ["b.apkg", "c.anki2", "a.anki2"]
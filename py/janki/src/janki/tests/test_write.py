@@ -0,0 +1,115 @@
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import shutil
+import sqlite3
+
+import pytest
+
+from janki.write import USN_UNSYNCED, Writer, field_checksum, strip_html_media
+
+from .conftest import TEST_COLLECTION
+
+NOW = 1_700_000_000.5
+MID = 1555579331146
+NID = 1555579337683
+
+
+@pytest.fixture
+def jk_db(tmp_path):
+    db_path = tmp_path / "collection.anki2"
+    shutil.copy2(TEST_COLLECTION, db_path)
+    db = sqlite3.connect(str(db_path))
+    yield db
+    db.close()
+
+
+def test_checksum():
+    assert field_checksum("Basic: Front") == 3213177027
+    assert field_checksum("<b>Basic:</b> Front&nbsp;") == field_checksum("Basic: Front")
+    assert strip_html_media('<img src="a.png"> b') == "a.png  b"
+
+
+def test_write(jk_db):
+    (notes_before,) = jk_db.execute("SELECT COUNT(*) FROM notes;").fetchone()
+    result = Writer(jk_db, NOW).write(
+        notes=[
+            {"mid": MID, "flds": ["<i>Haus</i>", "house"], "tags": " german "},
+            {"id": NID, "flds": "Front\x1fBack"},
+        ],
+        cards=[
+            {"nid": NID, "did": 1, "ord": 1},
+            {"id": 1, "nid": NID, "did": 1, "ord": 2},
+        ],
+    )
+    assert result["mod"] == int(NOW * 1000)
+    new_nid, updated_nid = result["notes"]
+    assert updated_nid == NID
+    assert new_nid >= result["mod"]
+
+    rows = jk_db.execute(
+        "SELECT id, mid, sfld, csum, mod, usn, guid FROM notes WHERE id IN (?, ?) "
+        "ORDER BY id;",
+        [NID, new_nid],
+    ).fetchall()
+    assert rows[0][:6] == (
+        NID,
+        1555579331147,
+        "Front",
+        field_checksum("Front"),
+        int(NOW),
+        USN_UNSYNCED,
+    )
+    assert rows[1][:6] == (
+        new_nid,
+        MID,
+        "Haus",
+        field_checksum("Haus"),
+        int(NOW),
+        USN_UNSYNCED,
+    )
+    assert rows[1][6]
+    assert (
+        jk_db.execute("SELECT COUNT(*) FROM notes;").fetchone()[0] == notes_before + 1
+    )
+
+    cards = jk_db.execute(
+        "SELECT id, ord, mod, usn, queue FROM cards WHERE id IN (?, ?) ORDER BY ord;",
+        result["cards"],
+    ).fetchall()
+    assert [card[1:] for card in cards] == [(1, int(NOW), -1, 0), (2, int(NOW), -1, 0)]
+    assert jk_db.execute("SELECT mod FROM col;").fetchone()[0] == result["mod"]
+
+
+def test_write_note_and_cards(jk_db):
+    note = {"id": 42, "mid": MID, "flds": ["Hund", "dog"]}
+    cards = [{"nid": 42, "did": 1557223292450, "ord": i} for i in range(2)]
+    result = Writer(jk_db, NOW).write(notes=[note], cards=cards)
+    assert result["notes"] == [42]
+    nids = jk_db.execute("SELECT nid FROM cards WHERE id IN (?, ?);", result["cards"])
+    assert [nid for (nid,) in nids] == [42, 42]
+
+
+@pytest.mark.parametrize(
+    "notes,cards",
+    [
+        ([{"flds": "a"}], []),
+        ([{"mid": MID, "flds": "a", "nope": 1}], []),
+        ([{"id": NID, "csum": 1}], []),
+        ([], [{"nid": NID}]),
+        ([], ["not a card"]),
+        ([{"mid": 7, "flds": "unknown note type"}], []),
+        ([{"mid": MID, "flds": 5}], []),
+        ([{"mid": MID, "flds": ["a", 1]}], []),
+        ([{"mid": str(MID), "flds": "a"}], []),
+        ([], [{"nid": 42, "did": 1, "ord": 0}]),
+        ([], [{"nid": NID, "did": 999, "ord": 0}]),
+        # the same card, twice
+        ([], [{"id": 1, "nid": NID, "did": 1, "ord": 0}] * 2),
+    ],
+)
+def test_bad_write(notes, cards, jk_db):
+    (before,) = jk_db.execute("SELECT mod FROM col;").fetchone()
+    with pytest.raises(ValueError):
+        Writer(jk_db, NOW).write(notes=[*notes], cards=[*cards])
+    assert jk_db.execute("SELECT mod FROM col;").fetchone()[0] == before
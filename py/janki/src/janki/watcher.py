@@ -0,0 +1,118 @@
+"""watch a directory for changed collections, with ``watchdog`` (e.g. inotify), if
+installed, or by polling
+"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import importlib.util
+from pathlib import Path
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from .cache import WAL_SUFFIX
+from .constants import EXTENSIONS
+
+
+def has_watchdog():
+    return importlib.util.find_spec("watchdog") is not None
+
+
+def collection_path(root_path, path):
+    """the ``/``-separated path of a collection (or its ``-wal``) under
+    ``root_path``, or ``None`` if it is elsewhere, hidden, or not a collection
+    """
+    path = str(path)
+
+    # changes to a collection open in anki are written to its write-ahead log
+    if path.endswith(WAL_SUFFIX):
+        path = path[: -len(WAL_SUFFIX)]
+
+    try:
+        relative = Path(path).relative_to(root_path)
+    except ValueError:
+        return None
+
+    if relative.suffix[1:] not in EXTENSIONS:
+        return None
+
+    if any(part.startswith(".") for part in relative.parts):
+        return None
+
+    return relative.as_posix()
+
+
+class PollingWatcher:
+    """find changed collections by rescanning a directory every ``interval``
+
+    ``scan`` is awaited for the fingerprints of collections by path, as from
+    ``catalog.scan``. ``on_change`` is called with each new, changed or removed path.
+    """
+
+    def __init__(self, scan, on_change, interval):
+        self.scan = scan
+        self.on_change = on_change
+        self.interval = interval
+        self._fingerprints = None
+        self._callback = None
+
+    def start(self):
+        self._callback = PeriodicCallback(self.poll, self.interval * 1000)
+        self._callback.start()
+        IOLoop.current().add_callback(self.poll)
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    async def poll(self):
+        found = await self.scan()
+        fingerprints = {path: stat["fingerprint"] for path, stat in found.items()}
+        previous, self._fingerprints = self._fingerprints, fingerprints
+
+        # the first scan is only the baseline
+        if previous is None:
+            return
+
+        for path in sorted({*previous, *fingerprints}):
+            if previous.get(path) != fingerprints.get(path):
+                self.on_change(path)
+
+
+class WatchdogWatcher:
+    """find changed collections from filesystem events, with ``watchdog``
+
+    events arrive on the observer's thread, and ``on_change`` is called on the
+    ``IOLoop`` which started the watcher
+    """
+
+    def __init__(self, root_path, on_change):
+        self.root_path = Path(root_path).resolve()
+        self.on_change = on_change
+        self._observer = None
+
+    def start(self):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        loop = IOLoop.current()
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                for path in [event.src_path, getattr(event, "dest_path", None)]:
+                    path = path and collection_path(watcher.root_path, path)
+                    if path:
+                        loop.add_callback(watcher.on_change, path)
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), str(self.root_path), recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
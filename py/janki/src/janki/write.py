@@ -0,0 +1,308 @@
+"""batches of inserts and updates of the notes and cards of a collection, applied in
+one transaction
+"""
+# Copyright (c) 2021 University System of Georgia and janki contributors
+# Distributed under the terms of the BSD-3-Clause License.
+
+import hashlib
+import html
+import json
+import random
+import re
+import sqlite3
+
+from .search import FIELD_SEPARATOR, RE_TAG
+
+#: the tables which may be written, in the order they are written
+WRITE_TABLES = ["notes", "cards"]
+
+#: the columns which must be given to insert a row
+REQUIRED = dict(notes=["mid", "flds"], cards=["nid", "did", "ord"])
+
+#: the columns which are always set by a write, and may not be given
+MAINTAINED = dict(notes=["mod", "usn", "sfld", "csum"], cards=["mod", "usn"])
+
+#: the values of the other columns of inserted rows, if not given
+DEFAULTS = dict(
+    notes=dict(tags="", flags=0, data=""),
+    cards=dict(
+        type=0,
+        queue=0,
+        due=0,
+        ivl=0,
+        factor=0,
+        reps=0,
+        lapses=0,
+        left=0,
+        odue=0,
+        odid=0,
+        flags=0,
+        data="",
+    ),
+)
+
+#: the columns which hold the ``id`` of a row, here or elsewhere
+ID_COLUMNS = ["id", "mid", "nid", "did"]
+
+#: the most ``id``s given as parameters to one query, well within SQLite's limit
+MAX_PARAMETERS = 500
+
+#: the update sequence number of changes not yet synced
+USN_UNSYNCED = -1
+
+#: the characters of note ``guid``s, as generated by anki
+GUID_CHARS = (
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    "!#$%&()*+,-./:;<=>?@[]^_`{|}~"
+)
+
+RE_MEDIA = re.compile(r"<img[^>]+src=[\"']?([^\"'>]+)[\"']?[^>]*>", re.I)
+
+
+def guid():
+    """a random note ``guid``, a base-91 64-bit number"""
+    value = random.getrandbits(64)
+    chars = ""
+    while value:
+        value, i = divmod(value, len(GUID_CHARS))
+        chars = GUID_CHARS[i] + chars
+    return chars or GUID_CHARS[0]
+
+
+def strip_html_media(field):
+    """the text of a field, with media replaced by its file name, and no HTML"""
+    field = RE_MEDIA.sub(r" \1 ", field)
+    return html.unescape(RE_TAG.sub("", field)).strip()
+
+
+def field_checksum(field):
+    """the first 8 hex digits of the sha1 of a stripped field, as an int"""
+    digest = hashlib.sha1(strip_html_media(field).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16)
+
+
+def sort_fields(db):
+    """the index of the sort field of each note type, where ``col.models`` has them
+
+    newer collections keep them in ``notetypes``, as protobuf, so the first field is
+    used
+    """
+    (models,) = db.execute("SELECT models FROM col;").fetchone()
+    try:
+        models = json.loads(models or "{}")
+    except ValueError:
+        return {}
+    return {int(mid): model.get("sortf", 0) for mid, model in models.items()}
+
+
+def has_table(db, table_name):
+    """whether an open collection has a table, as only newer ones have ``decks``
+    and ``notetypes``
+    """
+    return bool(
+        db.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?;",
+            [table_name],
+        ).fetchone()[0]
+    )
+
+
+def in_chunks(ids):
+    """``ids`` in lists short enough to be the parameters of one query"""
+    for i in range(0, len(ids), MAX_PARAMETERS):
+        yield ids[i : i + MAX_PARAMETERS]
+
+
+def _ids(db, table_name, col_column):
+    """the ``id``s in a table, or the keys of a ``col`` column in older collections"""
+    if has_table(db, table_name):
+        return {row_id for (row_id,) in db.execute(f"SELECT id FROM {table_name};")}
+
+    (value,) = db.execute(f"SELECT {col_column} FROM col;").fetchone()
+    return {int(row_id) for row_id in json.loads(value or "{}")}
+
+
+def note_type_ids(db):
+    return _ids(db, "notetypes", "models")
+
+
+def deck_ids(db):
+    return _ids(db, "decks", "decks")
+
+
+class Writer:
+    """apply inserts and updates to the notes and cards of an open collection
+
+    rows with the ``id`` of an existing row update the columns they give, and others
+    are inserted. ``mod`` and ``usn`` are set on every written row, and ``sfld`` and
+    ``csum`` on notes with ``flds``, which may be given as a list.
+    """
+
+    def __init__(self, db, now):
+        self.db = db
+        self.mod = int(now)
+        self.mod_ms = int(now * 1000)
+        self.sort_fields = sort_fields(db)
+        self.note_types = note_type_ids(db)
+        self.decks = deck_ids(db)
+
+    def write(self, notes=(), cards=()):
+        """write all the rows in one transaction, and mark the collection modified"""
+        rows = dict(notes=notes, cards=cards)
+        result = {}
+        self.db.isolation_level = None
+        self.db.execute("BEGIN IMMEDIATE;")
+
+        try:
+            for table_name in WRITE_TABLES:
+                result[table_name] = self.write_table(table_name, rows[table_name])
+            self.db.execute("UPDATE col SET mod = ?;", [self.mod_ms])
+        except BaseException as err:
+            self.db.execute("ROLLBACK;")
+            if isinstance(err, sqlite3.IntegrityError):
+                raise ValueError(f"the rows could not be written: {err}")
+            raise
+
+        self.db.execute("COMMIT;")
+
+        return {**result, "mod": self.mod_ms}
+
+    def write_table(self, table_name, rows):
+        """insert and update rows of one table, returning their ids, in order"""
+        columns = [
+            row[1] for row in self.db.execute(f"PRAGMA table_info({table_name});")
+        ]
+        rows = [self.check_row(table_name, columns, row) for row in rows]
+        self.check_references(table_name, rows)
+        ids = [row["id"] for row in rows if "id" in row]
+
+        # not every collection's tables have a primary key to enforce this
+        if len(set(ids)) != len(ids):
+            raise ValueError(f"{table_name} may only be written once per write")
+
+        existing = self.existing(table_name, ids)
+        (max_id,) = self.db.execute(f"SELECT MAX(id) FROM {table_name};").fetchone()
+        next_id = max(self.mod_ms, (max_id or 0) + 1)
+        inserts = []
+        updates = {}
+
+        for row in rows:
+            if row.get("id") in existing:
+                if table_name == "notes" and "flds" in row:
+                    row = self.with_sort_field(row, row.get("mid", existing[row["id"]]))
+                updates.setdefault(tuple(sorted(set(row) - {"id"})), []).append(row)
+                continue
+
+            missing = [c for c in REQUIRED[table_name] if c not in row]
+
+            if missing:
+                raise ValueError(f"new {table_name} need {', '.join(missing)}")
+
+            if "id" not in row:
+                row["id"], next_id = next_id, next_id + 1
+
+            row = {**DEFAULTS[table_name], **row}
+
+            if table_name == "notes":
+                row = self.with_sort_field({"guid": guid(), **row}, row["mid"])
+
+            inserts += [row]
+
+        self.insert(table_name, columns, inserts)
+
+        for update_columns, update_rows in updates.items():
+            self.update(table_name, update_columns, update_rows)
+
+        return [row["id"] for row in rows]
+
+    def check_row(self, table_name, columns, row):
+        if not isinstance(row, dict):
+            raise ValueError(f"{table_name} must be objects of columns")
+
+        row = dict(row)
+        unknown = sorted(set(row) - set(columns))
+        maintained = sorted(set(row) & set(MAINTAINED[table_name]))
+
+        if unknown:
+            raise ValueError(f"{table_name} has no columns {', '.join(unknown)}")
+
+        if maintained:
+            raise ValueError(f"{table_name} {', '.join(maintained)} are maintained")
+
+        for column in ID_COLUMNS:
+            value = row.get(column, 0)
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError(f"{table_name} {column} must be an integer")
+
+        flds = row.get("flds", "")
+
+        if isinstance(flds, list) and all(isinstance(f, str) for f in flds):
+            row["flds"] = FIELD_SEPARATOR.join(flds)
+        elif not isinstance(flds, str):
+            raise ValueError(f"{table_name} flds must be a string, or strings")
+
+        return row
+
+    def check_references(self, table_name, rows):
+        """raise ``ValueError`` if rows refer to note types, notes or decks which
+        do not exist, as notes are written first, in this write or before
+        """
+        if table_name == "notes":
+            references = dict(mid=("note types", self.note_types))
+        else:
+            nids = [row["nid"] for row in rows if "nid" in row]
+            notes = set(self.existing("notes", nids))
+            references = dict(nid=("notes", notes), did=("decks", self.decks))
+
+        for column, (name, known) in references.items():
+            unknown = sorted({row[column] for row in rows if column in row} - known)
+            if unknown:
+                raise ValueError(
+                    f"{table_name} refer to unknown {name}: "
+                    f"{', '.join(map(str, unknown))}"
+                )
+
+    def existing(self, table_name, ids):
+        """the existing ``id``s of a table, mapped to their note type, for notes"""
+        column = "mid" if table_name == "notes" else "NULL"
+        found = {}
+
+        for chunk in in_chunks(ids):
+            found.update(
+                self.db.execute(
+                    f"SELECT id, {column} FROM {table_name} "
+                    f"WHERE id IN ({', '.join('?' * len(chunk))});",
+                    chunk,
+                )
+            )
+
+        return found
+
+    def with_sort_field(self, note, mid):
+        """add the ``sfld`` and ``csum`` of a note's ``flds``"""
+        fields = note["flds"].split(FIELD_SEPARATOR)
+        sortf = self.sort_fields.get(mid, 0)
+        sort_field = fields[sortf] if sortf < len(fields) else ""
+        return {
+            **note,
+            "sfld": strip_html_media(sort_field),
+            "csum": field_checksum(fields[0]),
+        }
+
+    def insert(self, table_name, columns, rows):
+        values = {"mod": self.mod, "usn": USN_UNSYNCED}
+        self.db.executemany(
+            f"INSERT INTO {table_name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))});",
+            ([{**row, **values}.get(c) for c in columns] for row in rows),
+        )
+
+    def update(self, table_name, columns, rows):
+        assignments = ", ".join(f"{c} = ?" for c in [*columns, "mod", "usn"])
+        self.db.executemany(
+            f"UPDATE {table_name} SET {assignments} WHERE id = ?;",
+            (
+                [*(row[c] for c in columns), self.mod, USN_UNSYNCED, row["id"]]
+                for row in rows
+            ),
+        )